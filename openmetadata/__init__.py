@@ -15,9 +15,15 @@ Members:
     remove:   Remove from datastore
     find:     Return first match
     pull:     Read from datastore
+    preload:  Read a location and all of its metadata ahead of time
     inherit:  Read cascading from datastore
+    inherit_many: Read cascading for many locations at once
+    history:  Previous values of an entry, newest first
+    restore:  Write the value an entry had at a given time
+    compact_history: Remove imprints no longer retained
     read:     Convenience method for reading metadata
     write:    Convenience method for writing metadata
+    register_codec: Serialise values of a suffix differently
     ls:       List metacontent of node
 
 
@@ -12,18 +12,79 @@ Attributes:
 """
 
 import os
+import mmap
 import time
 import errno
+import atexit
+import bisect
 import shutil
 import logging
 import getpass
+import Queue
+import calendar
+import hashlib
+import tempfile
+import threading
+import cPickle
+import collections
+
+from multiprocessing.pool import ThreadPool
 
 from openmetadata import lib
 from openmetadata import util
 from openmetadata import error
+from openmetadata import journal
 
 log = logging.getLogger('openmetadata.api')
 
+# Where flush() tracks history by default; "directory" or "journal"
+HISTORY_STORE = 'directory'
+
+# Retention of every history without a retention of its own,
+# see set_retention(). None keeps every imprint.
+HISTORY_RETENTION = None
+
+# Persist history of flush() in the background, see flush_history().
+# Imprints not yet persisted are lost should the process be killed.
+HISTORY_ASYNC = False
+
+# Imprints awaiting being persisted in the background, at most
+HISTORY_QUEUE_SIZE = 1024
+
+# Store text in journals as deltas of lines, see journal.Journal.append()
+HISTORY_DELTA = False
+
+# Retention per absolute path of location, see set_retention()
+_retentions = dict()
+
+# Absolute paths of containers imprinted since last compacted,
+# see compact_history()
+_imprinted = set()
+
+# Maximum number of directory histories to keep sorted, see history()
+HISTORY_CACHE_SIZE = 256
+
+# Sorted basenames of each directory history, per listing, see history()
+_sorted_histories = collections.OrderedDict()
+_sorted_histories_lock = threading.Lock()
+
+# Hidden directories of a container, see pull()
+_hidden = (lib.HISTORY, lib.VERSIONS, lib.TRASH)
+
+# Bytes of values to keep preloaded, across every preload()
+PRELOAD_MAX_BYTES = 64 * 1024 ** 2
+
+# Serialised values read ahead of time, per absolute path, see preload()
+_preloaded = dict()
+_preloaded_bytes = 0
+_preloaded_lock = threading.Lock()
+
+# Plan operation per history store, see _plan_flush()
+_history_operations = {'directory': 'history', 'journal': 'journal'}
+
+# Directory in which to store inherited trees, see inherit()
+CACHE_DIR = os.environ.get('OPENMETADATA_CACHE')
+
 
 # Objects
 
@@ -40,6 +101,10 @@ Path = lib.Path
 Resource = lib.Resource
 Location = lib.Location
 Entry = lib.Entry
+Layers = lib.Layers
+
+# Serialisation
+register_codec = lib.register_codec
 
 # Include utilities
 find = util.find
@@ -52,6 +117,7 @@ __all__ = [
     'Resource',
     'Location',
     'Entry',
+    'Layers',
     'Path',
 
     # Main functionality
@@ -67,8 +133,18 @@ __all__ = [
     'default',
     'entry',
     'inherit',
+    'inherit_many',
+    'preload',
+    'unload',
+    'history',
+    'restore',
+    'flush_history',
+    'Retention',
+    'set_retention',
+    'compact_history',
     'islocation',
     'isentry',
+    'register_codec',
     'error'
 ]
 
@@ -97,6 +173,9 @@ def _remove(path):
     else:
         raise TypeError("%s is not a valid path" % path)
 
+    _forget(path)
+    util.invalidate(os.path.dirname(path))
+
 
 def _move(source, target):
     """
@@ -110,6 +189,43 @@ def _move(source, target):
         os.makedirs(dirname)
     shutil.move(source, target)
 
+    _forget(source)
+    util.invalidate(os.path.dirname(source))
+    util.invalidate(dirname)
+
+
+def _forget(path):
+    """Forget listings and preloaded values of `path` and below"""
+    util.invalidate(path, recursive=True)
+
+    global _preloaded_bytes
+
+    with _preloaded_lock:
+        for key in [key for key in _preloaded
+                    if key == path or util._within(key, path)]:
+            _preloaded_bytes -= len(_preloaded.pop(key))
+
+    with _sorted_histories_lock:
+        for key in [key for key in _sorted_histories
+                    if util._within(key, path)]:
+            del _sorted_histories[key]
+
+
+def _written(path):
+    """Forget what is known of file `path`, having been written to"""
+    global _preloaded_bytes
+
+    with _preloaded_lock:
+        data = _preloaded.pop(path, None)
+        if data is not None:
+            _preloaded_bytes -= len(data)
+
+    util.invalidate(os.path.dirname(path))
+
+
+# Files streamed to via Entry.open() are no longer as preloaded
+lib.write_hooks.append(_written)
+
 
 # ---------------------------------------------------------------------
 #
@@ -144,35 +260,116 @@ def flush(resource, track_history=False):
     store its current value, along with who and when. Finally,
     commit values to disk.
 
+    Finding and tracking is planned up-front for the full
+    hierarchy of `resource`, listing each affected directory
+    once, after which the plan is run. See :func:`_plan_flush`
+
+    Only dirty resources are flushed, clean subtrees are skipped
+    altogether. Flushed resources are made clean. Values identical
+    to what is already on disk are skipped too, and so is their
+    history.
+
+    History is stored in either of two ways; as a directory per
+    imprint, or appended to a single journal per container (see
+    :mod:`journal`). The former is the default, see `HISTORY_STORE`.
+    Containers with a :class:`Retention` are compacted in the
+    background afterwards, see :func:`set_retention`.
+
+    With `HISTORY_ASYNC`, previous values are read into memory
+    before being overwritten, but persisted into history by a
+    background writer, see :func:`flush_history`. New values are
+    then on disk before their imprints; should the process be killed
+    in between, the imprints yet to be persisted are lost.
+
     Arguments:
         resource (Resource): Location or Resource to flush
-        track_history (bool, optional): Produce history of `resource`
+        track_history (bool or str, optional): Produce history of
+            `resource`, in `HISTORY_STORE` or the store by this name;
+            either "directory" or "journal".
 
     Returns:
-        Resource: Unmodified
+        list: Entries skipped, as their value was already on disk
 
     """
 
-    if isinstance(resource, Location):
-        target = _flush_location
+    if not isinstance(resource, lib.Resource):
+        raise ValueError("Must pass object of type Resource")
+
+    plan = _plan_flush(resource, track_history=track_history)
+    return _run_plan(plan)
+
+
+def _plan_flush(resource, track_history=True):
+    """Produce operations required to flush `resource`
+
+    Each container affected by the flush is listed exactly once,
+    as opposed to once per entry, after which every rename, recycle,
+    history and write is worked out for the full hierarchy.
+
+    Operations are tuples of (operation, subject) where operation is
+    one of "history", "journal", "recycle", "makedirs", "write", "skip",
+    "clean" or "touch"; see :func:`_run_plan` for how they are carried out.
+
+    Each container modified is touched last, such that its
+    modification time reflects changes to any of its entries, however
+    deeply nested; see :func:`_cached_tree`.
+
+    Clean resources, along with their children, are left out.
+
+    Arguments:
+        resource (Resource): Location or Resource to plan
+        track_history (bool or str): Include history in plan, as per
+            :func:`flush`
+
+    Returns:
+        list: Operations, in the order in which to run them
+
+    """
 
-    elif isinstance(resource, lib.Resource):
-        target = _flush_entry
+    if track_history is True:
+        track_history = HISTORY_STORE
 
+    if track_history and track_history not in _history_operations:
+        raise ValueError("Unknown history store: %r" % track_history)
+
+    plan = list()
+    listings = dict()
+
+    # Directories known to exist, or to exist once
+    # the plan has run; used to combine makedirs.
+    directories = set()
+
+    if isinstance(resource, Location):
+        if resource.isdirty:
+            for child in resource:
+                _plan_entry(child, track_history, plan, listings, directories)
+            plan.append(('clean', resource))
     else:
-        raise ValueError("Must pass object of type Resource")
+        _plan_entry(resource, track_history, plan, listings, directories)
+
+    containers = list()
+    for operation, subject in plan:
+        if operation in ('recycle', 'write'):
+            container = subject.path.location + lib.Path.CONTAINER
+        elif operation == 'makedirs':
+            container = lib.Path(subject).location + lib.Path.CONTAINER
+        else:
+            continue
+
+        container = container.as_str
+        if container not in containers:
+            containers.append(container)
 
-    target(resource, track_history=track_history)
+    for container in containers:
+        plan.append(('touch', container))
 
+    return plan
 
-def _flush_location(resource, track_history=True):
-    for child in resource:
-        _flush_entry(child, track_history)
 
+def _plan_entry(resource, track_history, plan, listings, directories):
+    if not resource.isdirty:
+        return
 
-def _flush_entry(resource, track_history=True):
-    parent = resource.parent
-    history_resource = resource
     existing_resource = None
 
     #  _______________
@@ -184,16 +381,31 @@ def _flush_entry(resource, track_history=True):
     #
     # Track and recycle existing
 
-    name = resource.path.name
+    parent_path = resource.path.parent.as_str
+    listing = _listing(parent_path, listings, directories)
 
-    existing = find(parent.path.as_str, name)
+    existing = listing.get(resource.path.name.lower())
     if existing:
-        existing_resource = Entry(existing, parent=parent)
+        # Bypass `parent.add()`; the existing resource is only
+        # a reference to what is on disk and mustn't replace
+        # `resource` amongst the children of `parent`.
+        existing_resource = resource._sibling(existing[0])
+
+    path = resource.path.as_str
+
+    # Leave values already on disk, along with their history, untouched
+    if existing_resource and resource.path == existing_resource.path:
+        if resource.type not in ('dict', 'list'):
+            if _unchanged(path, resource.dump()):
+                plan.append(('skip', resource))
+                plan.append(('clean', resource))
+                return
 
     history_resource = existing_resource or resource
     if not history_resource.type in ('dict', 'list'):
         if track_history:
-            _make_history(history_resource)
+            operation = _history_operations[track_history]
+            plan.append((operation, history_resource))
 
     #  _______________
     # |      -->      |
@@ -208,7 +420,10 @@ def _flush_entry(resource, track_history=True):
         # TODO: this should really be permanent, as the copy
         # has already been stored in history. But, for safety
         # let's keep it around until someone complains about it.
-        recycle(existing_resource, permanent=False)
+        plan.append(('recycle', existing_resource))
+
+        # Whatever was listed at `path` is on its way to the trash
+        listings[path] = dict()
 
     #  _______________
     # |      -->      |
@@ -221,44 +436,168 @@ def _flush_entry(resource, track_history=True):
 
     # Resource is a directory
     if resource.type in ('dict', 'list'):
-        try:
-            os.makedirs(resource.path.as_str)
-        except OSError as e:
-            if e.errno == errno.EEXIST:
-                pass
+        _plan_makedirs(path, plan, directories)
 
         for child in resource:
-            flush(child, track_history)
+            _plan_entry(child, track_history, plan, listings, directories)
 
     # Resource is a file
     else:
-        assert resource.type, resource.path.as_str
+        assert resource.type, path
+
+        _plan_makedirs(parent_path, plan, directories)
+        plan.append(('write', resource))
 
-        path = resource.path.as_str
-        value = resource.dump()
+    plan.append(('clean', resource))
 
-        dirname = os.path.dirname(path)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
 
-        if value is None:
-            value = ''
+def _plan_makedirs(path, plan, directories):
+    if path not in directories:
+        plan.append(('makedirs', path))
+        directories.add(path)
 
-        with open(path, 'w') as f:
+
+def _listing(path, listings, directories):
+    """Return listing of `path`, listing each directory only once"""
+    try:
+        return listings[path]
+    except KeyError:
+        listing = util.index(path)
+        if listing is not None:
+            directories.add(path)
+        listing = listings[path] = listing or dict()
+        return listing
+
+
+def _unchanged(path, value):
+    """Return whether `value` is what is already stored at `path`
+
+    Sizes are compared first, such that only values of
+    identical size are read back from disk.
+
+    """
+
+    if value is None:
+        value = ''
+
+    try:
+        if os.stat(path).st_size != len(value):
+            return False
+    except OSError:
+        return False
+
+    chunksize = 1024 * 1024
+    with open(path, 'rb') as f:
+        for offset in xrange(0, len(value), chunksize):
+            chunk = value[offset:offset + chunksize]
+            if f.read(chunksize) != chunk:
+                return False
+
+    return True
+
+
+def _run_plan(plan):
+    """Carry out operations produced by :func:`_plan_flush`
+
+    Returns:
+        list: Subjects of "skip" operations
+
+    """
+
+    skipped = list()
+    tracked = list()
+
+    for operation, subject in plan:
+        if operation == 'history':
+            _track_history(subject, 'directory')
+            tracked.append(subject.path.parent.as_str)
+
+        elif operation == 'journal':
+            _track_history(subject, 'journal')
+            tracked.append(subject.path.parent.as_str)
+
+        elif operation == 'recycle':
+            recycle(subject, permanent=False)
+
+        elif operation == 'makedirs':
+            try:
+                os.makedirs(subject)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            util.invalidate(os.path.dirname(subject))
+
+        elif operation == 'write':
+            _write_entry(subject)
+            _written(subject.path.as_str)
+
+        elif operation == 'skip':
+            log.info("flush(): Unchanged: %r" % subject.path.as_str)
+            skipped.append(subject)
+
+        elif operation == 'clean':
+            subject.isdirty = False
+
+        elif operation == 'touch':
+            try:
+                os.utime(subject, None)
+            except OSError:
+                pass
+
+        else:
+            raise ValueError("Unknown operation: %r" % operation)
+
+    for container in set(tracked):
+        if _retention_of(container) is not None:
+            _compactor.submit(container)
+
+    return skipped
+
+
+def _write_entry(resource):
+    path = resource.path.as_str
+    value = resource.dump()
+
+    if value is None:
+        value = ''
+
+    if lib.get_codec(resource.type).mapped:
+        # The value may be mapped from the very file we are about
+        # to write; write alongside it and replace it once written,
+        # leaving the original intact for the existing mapping.
+        temp = os.path.join(os.path.dirname(path),
+                            lib.TEMP + os.path.basename(path))
+        with open(temp, 'wb') as f:
             f.write(value)
 
-        log.info("flush(): Successfully flushed: %r" % path)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
 
-    return resource
+    else:
+        with open(path, 'wb') as f:
+            f.write(value)
+
+    log.info("flush(): Successfully flushed: %r" % path)
 
 
-def pull(resource, lazy=False, depth=1, merge=False, _currentlevel=1):
+def pull(resource, lazy=False, depth=1, merge=False,
+         defer=False, validate=False, hidden=True, workers=None):
     """Physically retrieve value from datastore.
 
     Arguments:
         lazy (bool): Only pull if no existing value already exists
         depth (int): Pull `resource` and `depth` levels of children
         merge (bool): Combine results with existing value of `resource`
+        defer (bool): Only list entries, reading the value of each
+            upon first accessing it. See :meth:`lib.Resource.defer`
+        validate (bool): When deferred, re-read values whose file
+            has been modified since last read, upon each access.
+        hidden (bool): Include history, versions and trash amongst
+            children. When False, these are skipped whilst listing.
+        workers (int, optional): With a `depth` beyond 1, list and read
+            the children of each level using this many threads. The
+            result is identical to pulling without.
 
     Raises:
         error.Exists
@@ -269,9 +608,99 @@ def pull(resource, lazy=False, depth=1, merge=False, _currentlevel=1):
 
     """
 
+    options = {'lazy': lazy,
+               'merge': merge,
+               'defer': defer,
+               'validate': validate,
+               'hidden': hidden}
+
+    if workers and depth > 1:
+        _pull_parallel(resource, depth, workers, options)
+    else:
+        _pull(resource, depth, options)
+
+    return resource
+
+
+def _pull(resource, depth, options, level=1, isdir=None):
+    """Pull `resource`, followed by its children, depth-first"""
+    listed = _pull_node(resource, isdir, **options)
+    if listed is None:
+        return
+
+    # Continue pulling children until `depth` is reached
+    if level < depth:
+        if _iscollection(resource):
+            for child in resource:
+                _pull(child, depth, options, level + 1,
+                      _isdir_of(listed.get(child.path.basename)))
+
+    # Merged children may still hold values not yet on disk
+    resource.isdirty = options['merge'] and any(child.isdirty
+                                                for child in resource)
+
+
+def _pull_parallel(resource, depth, workers, options):
+    """Pull `resource`, followed by its children, breadth-first
+
+    Every resource of a level is pulled concurrently, such that
+    latency, rather than bandwidth, is spread across `workers`.
+    Each thread only ever modifies the resource it pulls.
+
+    """
+
+    def pull_node(task):
+        node, isdir = task
+        return node, _pull_node(node, isdir, **options)
+
+    levels = list()
+    tasks = [(resource, None)]
+
+    pool = ThreadPool(workers)
+    try:
+        for level in range(1, depth + 1):
+            pulled = [(node, listed)
+                      for node, listed in pool.map(pull_node, tasks)
+                      if listed is not None]
+            levels.append([node for node, _ in pulled])
+
+            if level == depth:
+                break
+
+            tasks = list()
+            for node, listed in pulled:
+                if _iscollection(node):
+                    for child in node:
+                        item = listed.get(child.path.basename)
+                        tasks.append((child, _isdir_of(item)))
+    finally:
+        pool.close()
+        pool.join()
+
+    # Dirtiness depends on children, and is resolved bottom-up
+    for nodes in reversed(levels):
+        for node in nodes:
+            node.isdirty = options['merge'] and any(child.isdirty
+                                                    for child in node)
+
+
+def _pull_node(resource, isdir, lazy, merge, defer, validate, hidden):
+    """Pull `resource` alone, without its children
+
+    Arguments:
+        isdir (bool): Whether `resource` is known to exist as either
+            a directory or file, from the listing of its parent,
+            or None if unknown.
+
+    Returns:
+        dict: Listed Item per basename of each child,
+            or None if `resource` was left as-is.
+
+    """
+
     path = resource.path
 
-    if not os.path.exists(path.as_str):
+    if isdir is None and not _exists(path.as_str):
         """
         If the name of `resource` has been entered manually, chances
         are that there is an existing resource on disk under a different
@@ -291,64 +720,273 @@ def pull(resource, lazy=False, depth=1, merge=False, _currentlevel=1):
 
         try:
             resource._path = path.copy(path=similars[0])
+            resource._invalidate()
         except IndexError:
             raise error.Exists("{} does not exist".format(path))
-        else:
-            return pull(resource,
-                        lazy=lazy,
-                        depth=depth,
-                        merge=merge,
-                        _currentlevel=_currentlevel)
+
+        path = resource.path
 
     # if not (isinstance(resource, Location) or resource.type):
     #     raise error.Corrupt(
     #         "Resource did not have type: {}".format(path))
 
     if lazy and resource.has_value:
-        return resource
+        return None
 
     if not merge:
         resource.clear()
 
     path = path.as_str
-    if os.path.isdir(path):
-        for _, dirs, files in os.walk(path):
-            for entry in dirs:
-                Entry(entry, parent=resource)
+    if path in _preloaded:
+        isdir = False
 
-            for entry in files:
-                Entry(entry, parent=resource)
+    items = util.listdir(path) if isdir is not False else None
+    listed = dict()
 
-            break
+    if items is not None:
+        for item in items:
+            if not hidden and item.basename in _hidden:
+                continue
+
+            child = Entry(item.basename, parent=resource)
+            child.isdirty = False
+            listed[item.basename] = item
+
+    elif defer and path not in _preloaded:
+        resource.defer(_Deferred(path, validate=validate))
 
     else:
+        _load(resource, path)
+
+    return listed
+
+
+def _exists(path):
+    if path in _preloaded or util._pinned.get(path) is not None:
+        return True
+    return os.path.exists(path)
+
+
+def _iscollection(resource):
+    return isinstance(resource, Location) or resource.type in ('dict', 'list')
+
+
+def _isdir_of(item):
+    return item.isdir if item is not None else None
+
+
+def preload(location, depth=None, workers=8, max_bytes=None):
+    """Read all of `location` ahead of time
+
+    The container of `location` is walked once, listing directories
+    and reading every value of each level in parallel. Listings and
+    values are kept in memory, such that pulling or reading anything
+    preloaded no longer touches disk at all.
+
+    Memory is bounded by `max_bytes`, across every call; values that
+    do not fit are left to be read upon pulling, as usual, whereas
+    smaller values may still fit. Preloaded values are kept until
+    modified or removed through this process, or released via
+    :func:`unload`; modifications by other processes go unnoticed.
+
+    Example:
+        >> location = preload('/projects/spiderman/1000')
+        >> read('/projects/spiderman/1000', 'apps/maya/name')
+
+    Arguments:
+        location (str or Location): Location to preload
+        depth (int, optional): Levels to preload, as per :func:`pull`,
+            or None for every level.
+        workers (int, optional): Number of threads reading concurrently
+        max_bytes (int, optional): Maximum bytes of values to keep
+            preloaded in total, defaults to `PRELOAD_MAX_BYTES`
+
+    Returns:
+        Location: Pulled to `depth`, or as deep as it goes
+
+    """
+
+    if isinstance(location, basestring):
+        location = Location(location)
+
+    global _preloaded_bytes
+
+    if max_bytes is None:
+        max_bytes = PRELOAD_MAX_BYTES
+
+    def list_(path):
+        items = util.listdir(path)
+        if items is not None:
+            util.pin(path, items)
+            for item in items:
+                item.isdir  # Classify whilst in parallel
+        return items
+
+    def read(path):
+        room = max_bytes - _preloaded_bytes
+        if room <= 0:
+            return path, None
+
         try:
-            with open(path, 'r') as f:
-                value = f.read()
-        except IOError as e:
-            if e.errno == errno.ENOENT:
-                raise error.Exists(path)
-            elif e.errno == errno.EACCES:
-                raise error.Exists("Make sure this is a file "
-                                   "and that you have the appropriate "
-                                   "permissions: {}".format(path))
-
-        # Empty files return an empty string
-        if value != "":
-            resource.load(value)
+            with open(path, 'rb') as f:
+                data = f.read(room + 1)
+        except IOError:
+            return path, None
 
-    # Continue pulling children until `depth` is reached
-    if _currentlevel < depth:
-        if resource.type in ('dict', 'list'):
-            for child in resource:
-                pull(child,
-                     lazy=lazy,
-                     depth=depth,
-                     merge=merge,
-                     _currentlevel=_currentlevel + 1)
+        if len(data) > room:
+            # Too large for what is left; smaller ones may still fit
+            return path, None
 
-    resource.isdirty = False
-    return resource
+        return path, data
+
+    level = 1
+    directories = [location.path.as_str]
+
+    pool = ThreadPool(workers)
+    try:
+        while directories:
+            files = list()
+            subdirectories = list()
+
+            for items in pool.map(list_, directories):
+                for item in items or ():
+                    if item.isdir:
+                        subdirectories.append(item.path)
+                    else:
+                        files.append(item.path)
+
+            if depth is not None and level >= depth:
+                break
+
+            level += 1
+
+            for path, data in pool.imap_unordered(read, files):
+                if data is None:
+                    continue
+
+                with _preloaded_lock:
+                    size = len(data) - len(_preloaded.get(path, ''))
+                    if _preloaded_bytes + size <= max_bytes:
+                        _preloaded_bytes += size
+                        _preloaded[path] = data
+
+            directories = subdirectories
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return pull(location, depth=level)
+
+
+def unload(location=None):
+    """Release listings and values preloaded for `location`, or all"""
+    global _preloaded_bytes
+
+    if location is None:
+        with _preloaded_lock:
+            _preloaded.clear()
+            _preloaded_bytes = 0
+        util.invalidate()
+        return
+
+    if isinstance(location, basestring):
+        location = Location(location)
+
+    _forget(location.path.as_str)
+
+
+def _load(resource, path):
+    """Load serialised value at `path` into `resource`
+
+    Values of suffixes whose codec is `mapped` are mapped
+    into memory, as opposed to being read. Preloaded values
+    are used as-is, see :func:`preload`.
+
+    """
+
+    value = _preloaded.get(path)
+
+    if value is not None:
+        pass
+    elif lib.get_codec(resource.type).mapped:
+        value = _map(path)
+    else:
+        value = _read(path)
+
+    # Empty files return an empty string
+    if value != "":
+        resource.load(value)
+
+
+def _map(path):
+    """Return read-only, zero-copy view of contents at `path`"""
+    try:
+        with open(path, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                return ""
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            raise error.Exists(path)
+        raise
+
+    # The mapping remains open for as long as the view exists
+    try:
+        return memoryview(mapped)
+    except TypeError:
+        # Python 2 mappings only support buffer()
+        return buffer(mapped)
+
+
+def _read(path):
+    """Return serialised value at `path`"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            raise error.Exists(path)
+        elif e.errno == errno.EACCES:
+            raise error.Exists("Make sure this is a file "
+                               "and that you have the appropriate "
+                               "permissions: {}".format(path))
+        raise
+
+
+class _Deferred(object):
+    """Read value of `path` upon first accessing it
+
+    Arguments:
+        path (str): Absolute path to file from which to read
+        validate (bool): Re-read upon each access, if modified
+
+    """
+
+    __slots__ = ('path', 'validate', 'mtime')
+
+    def __init__(self, path, validate=False):
+        self.path = path
+        self.validate = validate
+        self.mtime = None
+
+    def __call__(self, resource):
+        if self.validate:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                raise error.Exists(self.path)
+
+            if mtime == self.mtime:
+                return True
+
+            self.mtime = mtime
+
+        _load(resource, self.path)
+
+        return self.validate
 
 
 def recycle(resource, permanent=False):
@@ -415,91 +1053,764 @@ def trash(resource):
     log.info("remove(): Successfully removed %r" % resource.path.as_str)
 
 
-def history(resource):
-    pass
+class DirectoryImprint(object):
+    """Previous value of an entry, as stored in a directory of its own
 
+    Mirrors :class:`journal.Imprint`; user and value are
+    read from disk upon first being accessed.
 
-def restore(resource):
-    pass
+    Attributes:
+        path: Absolute path of imprint directory
+        name: Name of entry, excluding suffix
+        time: Time of imprint, as per _currenttime()
 
+    """
 
-def _make_history(resource):
-    """Store value of `resource` as-is on disk in history
+    __slots__ = ('path', 'name', 'time', '_value_item')
 
-    Arguments:
-        resource (Resource): Resource from which to make history.
+    def __init__(self, path, name, time):
+        self.path = path
+        self.name = name
+        self.time = time
+        self._value_item = None
 
-    """
+    def __repr__(self):
+        return "%s.%s(%r, %r)" % (__name__, type(self).__name__,
+                                  self.basename, self.time)
 
-    # We'll be pulling data into a copy, rather than the
-    # original, so as to avoid overwriting any existing value.
-    copy = resource.copy()
+    @property
+    def suffix(self):
+        item = self._item()
+        return item.suffix if item else None
 
-    try:
-        pull(copy, lazy=True)
-    except error.Exists:
-        # If it doesn't exist, we can't make history.
-        return
+    @property
+    def basename(self):
+        if self.suffix:
+            return self.name + lib.Path.EXT + self.suffix
+        return self.name
 
-    try:
-        parent = resource.parent
-
-        # Avoid our `copy` adding itself as a child
-        # to `parent`; this would cause the dictionary
-        # containing the parent's children to change.
-        #   Python doesn't like this.
-        parent = parent.copy()
-    except StopIteration:
-        return
+    @property
+    def user(self):
+        try:
+            data = _read(os.path.join(self.path, 'user.string'))
+        except error.Exists:
+            return None
+        return lib.get_codec('string').decode(data)
+
+    @property
+    def data(self):
+        """Value, as serialised on disk"""
+        item = self._item()
+        if item is None:
+            return ""
+        return _read(item.path)
+
+    @property
+    def value(self):
+        data = self.data
+        if data == "":
+            return None
+        return lib.get_codec(self.suffix).decode(data)
 
-    # Prepare name of `imprint` (see RFC12)
-    name = resource.path.name
-    imprint_time = _currenttime()
-    imprint_name = "{name}{sep}{time}".format(name=name,
-                                              sep=lib.Path.QUERYSEP,
-                                              time=imprint_time)
-    # Get previous value
-    old_value = pull(copy).value
-    old_suffix = copy.path.suffix
+    def _item(self):
+        if self._value_item is None:
+            for item in util.listdir(self.path) or ():
+                if item.name == 'value':
+                    self._value_item = item
+                    break
+        return self._value_item
 
-    # Construct history group
-    history = Entry('.history', parent=parent)
-    imprint = Entry(imprint_name, parent=history)
 
-    Entry('user.string', value=getpass.getuser(), parent=imprint)
-    Entry('value.{}'.format(old_suffix), value=old_value, parent=imprint)
+def history(resource, since=None, until=None, limit=None):
+    """Return imprints of `resource`, newest first
 
-    flush(history, track_history=False)
+    Imprints of either store are looked up by binary search over
+    their names and times, sorted once per listing of the history
+    directory or revision of the journal. No values are read until
+    asked for, via the `value` of each imprint. Imprints still being
+    persisted in the background are waited for, see :func:`flush`.
 
-    log.info("_make_history(): Successfully made history for %s (value=%s)"
-             % (copy, copy.value))
+    Arguments:
+        resource (Entry): Entry of which to return imprints
+        since (str or float, optional): Earliest time, inclusive, as
+            per _currenttime() or in seconds since epoch
+        until (str or float, optional): Latest time, inclusive
+        limit (int, optional): Return at most this many imprints
 
+    Returns:
+        list: Imprints, with `name`, `suffix`, `time`, `user`
+            and `value`; see :class:`DirectoryImprint` and
+            :class:`journal.Imprint`
 
-# ---------------------------------------------------------------------
-#
-# Cascading Metadata, RFC12
-# http://rfc.abstractfactory.io/spec/12
-#
-# ---------------------------------------------------------------------
+    """
 
+    return _history(resource, since, until, limit, newest=True)
 
-def inherit(resource, depth=0, merge=False, lazy=False):
-    """Inherit `resource` from above hierarchy
 
-    Inheritance works much like it does in programming; any value
-    present in a superclass is added, subclasses then overrides those
-    values.
+def _history(resource, since, until, limit, newest):
+    """Imprints of `resource`, `limit` of the newest or oldest"""
+    _history_writer.join()
 
-    Specification - http://rfc.abstractfactory.io/spec/12/
+    path = resource.path
+    container = path.parent.as_str
+    since, until = _imprint_time(since), _imprint_time(until)
 
-    Parameters:
-        resource (str): Adding inherited values to this.
-        depth (int): How far up a hierarchy to inherit from, 0 means unlimited
-        merge (bool): Either keep current values and merge new, or clear first.
-        pull (bool): Not pulling will only fill up the mro (see RFC12)
-        lazy (bool): Should I bother reading when values already exists?
+    imprints = list()
+    for found in (_directory_between(container, path.name, since, until),
+                  journal.Journal(container).between(path.name,
+                                                     since, until)):
+        if limit is not None:
+            found = found[-limit:] if newest else found[:limit]
+        imprints.extend(found)
 
-    """
+    # Imprints within each store are already in order,
+    # including those made within the same second
+    imprints.sort(key=lambda imprint: imprint.time)
+    if newest:
+        imprints.reverse()
+
+    if limit is not None:
+        imprints = imprints[:limit]
+
+    return imprints
+
+
+def _directory_between(container, name, since, until):
+    """Directory imprints of `name` from `since` until `until`"""
+    history = os.path.join(container, lib.HISTORY)
+    listing = util.listdir(history)
+    if not listing:
+        return list()
+
+    with _sorted_histories_lock:
+        cached = _sorted_histories.pop(history, None)
+
+    if cached is None or cached[0] is not listing:
+        cached = (listing, sorted(item.basename for item in listing))
+
+    with _sorted_histories_lock:
+        _sorted_histories.pop(history, None)
+        if len(_sorted_histories) >= HISTORY_CACHE_SIZE:
+            _sorted_histories.popitem(last=False)
+
+        # Most recently used are kept last
+        _sorted_histories[history] = cached
+
+    basenames = cached[1]
+
+    prefix = name + lib.Path.QUERYSEP
+    lower = bisect.bisect_left(basenames, prefix + (since or ''))
+    upper = bisect.bisect_right(basenames, prefix + (until or '~') + '~')
+
+    imprints = list()
+    for basename in basenames[lower:upper]:
+        stamp = basename[len(prefix):]
+        if not stamp.endswith('.dict'):
+            continue
+
+        imprints.append(DirectoryImprint(os.path.join(history, basename),
+                                         name,
+                                         stamp[:-len('.dict')]))
+
+    return imprints
+
+
+def _imprint_time(when):
+    """Time of imprint from `when`, in seconds since epoch or as-is"""
+    if when is None or isinstance(when, basestring):
+        return when
+    return time.strftime("%Y%m%d-%H%M%S", time.gmtime(when))
+
+
+def restore(resource, when, track_history=True):
+    """Restore the value `resource` had at `when`
+
+    The value at `when` is that of the earliest imprint made after
+    it, as each imprint holds the value it replaced. It is found by
+    binary search, see :func:`history`, and written in a single flush.
+
+    Example:
+        >>> import tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> location = Location(root)
+        >>> height = Entry('height', value=10, parent=location)
+        >>> _ = flush(location)
+        >>> height.value = 11
+        >>> _ = flush(height, track_history=True)
+        >>> imprint, = history(height)
+        >>> _ = restore(height, imprint)
+        >>> height.value
+        10
+        >>> shutil.rmtree(root)
+
+    Arguments:
+        resource (Entry): Entry to restore
+        when (str, float or imprint): Time, as per _currenttime() or
+            in seconds since epoch, or an imprint as per :func:`history`
+        track_history (bool or str, optional): Produce history of
+            the value being replaced, see :func:`flush`
+
+    Returns:
+        Imprint restored, or None if the value has not
+            changed since `when`
+
+    """
+
+    if isinstance(when, (DirectoryImprint, journal.Imprint)):
+        imprint = when
+
+    else:
+        stamp = _imprint_time(when)
+        seconds = _imprint_seconds(stamp)
+        if seconds is None:
+            raise ValueError("Invalid time: %r" % when)
+
+        imprints = _history(resource, _imprint_time(seconds + 1), None,
+                            limit=1, newest=False)
+        if not imprints:
+            return None
+
+        imprint, = imprints
+
+    _assign_serialised(resource, imprint.suffix, imprint.data)
+
+    flush(resource, track_history=track_history)
+
+    return imprint
+
+
+def _make_history(resource, store='directory'):
+    """Store value of `resource` as-is on disk in history
+
+    The value is copied exactly as serialised on disk, into the
+    history of the container of `resource`; either as a directory
+    of its own or appended to its journal.
+
+        # Directory
+        $ /home/marcus/.meta/.history/height&20140101-120000.dict/
+            user.string
+            value.int
+
+        # Journal
+        $ /home/marcus/.meta/.history/journal
+
+    Arguments:
+        resource (Resource): Resource from which to make history.
+        store (str): Either "directory" or "journal"
+
+    """
+
+    imprint = _capture_history(resource, store)
+    if imprint is not None:
+        _write_history(*imprint)
+
+
+def _capture_history(resource, store='directory'):
+    """Read value of `resource` as-is on disk, for _write_history()
+
+    Returns:
+        tuple: Arguments to :func:`_write_history`, or None
+            if there is no value of which to make history
+
+    """
+
+    path = resource.path
+
+    try:
+        data = _read(path.as_str)
+    except error.Exists:
+        # If it doesn't exist, we can't make history.
+        return None
+
+    return (store,
+            path.parent.as_str,
+            path.name,
+            path.suffix,
+            data,
+            getpass.getuser(),
+            _currenttime())
+
+
+def _write_history(store, container, name, suffix, data, user,
+                   imprint_time):
+    """Store imprint of `name` within `container`, see _make_history()"""
+    if store == 'journal':
+        journal.Journal(container).append(name,
+                                          suffix,
+                                          data,
+                                          user,
+                                          imprint_time,
+                                          delta=HISTORY_DELTA)
+
+    else:
+        # Prepare name of `imprint` (see RFC12)
+        imprint_name = "{name}{sep}{time}.dict".format(
+            name=name,
+            sep=lib.Path.QUERYSEP,
+            time=imprint_time)
+
+        imprint = os.path.join(container, lib.HISTORY, imprint_name)
+        if not os.path.exists(imprint):
+            os.makedirs(imprint)
+
+        value_name = 'value'
+        if suffix:
+            value_name += lib.Path.EXT + suffix
+
+        for basename, serialised in (
+                ('user.string', lib.get_codec('string').encode(user)),
+                (value_name, data)):
+            with open(os.path.join(imprint, basename), 'wb') as f:
+                f.write(serialised)
+
+    util.invalidate(container)
+    util.invalidate(os.path.join(container, lib.HISTORY))
+    _imprinted.add(container)
+
+    log.info("_make_history(): Successfully made history for %s"
+             % os.path.join(container, name))
+
+
+def _track_history(resource, store):
+    """Make history of `resource`, in the background if HISTORY_ASYNC"""
+    if HISTORY_ASYNC:
+        imprint = _capture_history(resource, store)
+        if imprint is not None:
+            _history_writer.put(imprint)
+
+    else:
+        # Imprints captured earlier are persisted first
+        _history_writer.join()
+        _make_history(resource, store)
+
+
+def flush_history():
+    """Block until every imprint captured by flush() is persisted
+
+    With `HISTORY_ASYNC`, imprints are persisted by a writer of its
+    own, in the order in which they were captured, see :func:`flush`.
+    Until this returns, history of what was flushed is held only in
+    memory, and lost should the process be killed.
+
+    Raises:
+        Exception: The first error met by the writer since
+            the previous call, after every imprint is persisted
+
+    """
+
+    _history_writer.join()
+
+    errors = _history_writer.errors()
+    if errors:
+        raise errors[0]
+
+
+class _HistoryWriter(object):
+    """Persist imprints on a thread of its own, see flush()
+
+    Imprints are persisted one at a time, in the order in which they
+    were captured. Those still queued are lost should the process be
+    killed, though the values they were captured from are replaced
+    already. Once `HISTORY_QUEUE_SIZE` imprints await being
+    persisted, capturing more blocks until there is room.
+
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._errors = list()
+
+    def put(self, imprint):
+        """Persist `imprint`, arguments to _write_history()"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._queue is None:
+                    self._queue = Queue.Queue(HISTORY_QUEUE_SIZE)
+
+                self._thread = threading.Thread(target=self._run,
+                                                name='openmetadata.history')
+                self._thread.daemon = True
+                self._thread.start()
+
+            # Follow changes to HISTORY_QUEUE_SIZE
+            queue = self._queue
+            if queue.maxsize != HISTORY_QUEUE_SIZE:
+                with queue.mutex:
+                    queue.maxsize = HISTORY_QUEUE_SIZE
+                    queue.not_full.notify_all()
+
+        self._queue.put(imprint)
+
+    def join(self):
+        """Block until every imprint put is persisted"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def errors(self):
+        """Return and forget errors met since the previous call"""
+        with self._lock:
+            errors, self._errors = self._errors, list()
+        return errors
+
+    def _run(self):
+        while True:
+            imprint = self._queue.get()
+
+            try:
+                _write_history(*imprint)
+            except Exception as e:
+                log.exception("Could not make history of %s"
+                              % os.path.join(imprint[1], imprint[2]))
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+
+_history_writer = _HistoryWriter()
+
+# Persist imprints captured but not yet written, before exiting
+atexit.register(_history_writer.join)
+
+
+class Retention(object):
+    """Which imprints of each entry to keep in history
+
+    An imprint is kept if any of the criteria given holds for it,
+    with no criteria given, every imprint is kept.
+
+    Example:
+        >>> retention = Retention(last=2)
+        >>> times = ['20140101-000000', '20140102-000000', '20140103-000000']
+        >>> sorted(retention.select(times))
+        [1, 2]
+        >>> retention = Retention(daily=0)
+        >>> sorted(retention.select(['20140101-000000', '20140101-120000',
+        ...                          '20140102-000000']))
+        [1, 2]
+
+    Arguments:
+        last (int, optional): Keep the latest `last` imprints
+        newer (float, optional): Keep imprints younger than this
+            many seconds
+        daily (float, optional): Keep imprints younger than this many
+            seconds, and only the latest imprint of each day beyond
+
+    """
+
+    __slots__ = ('last', 'newer', 'daily')
+
+    def __init__(self, last=None, newer=None, daily=None):
+        self.last = last
+        self.newer = newer
+        self.daily = daily
+
+    def __repr__(self):
+        return "%s.%s(last=%r, newer=%r, daily=%r)" % (
+            __name__, type(self).__name__, self.last, self.newer, self.daily)
+
+    def select(self, times, now=None):
+        """Return indexes of imprints to keep
+
+        Arguments:
+            times (list): Time of each imprint, as per _currenttime(),
+                oldest first
+            now (float, optional): Seconds since epoch, defaults
+                to the current time
+
+        """
+
+        if self.last is None and self.newer is None and self.daily is None:
+            return set(range(len(times)))
+
+        if now is None:
+            now = time.time()
+
+        kept = set()
+        if self.last:
+            kept.update(range(max(0, len(times) - self.last), len(times)))
+
+        days = dict()
+        for index, stamp in enumerate(times):
+            seconds = _imprint_seconds(stamp)
+
+            if seconds is None:
+                # Not ours to judge
+                kept.add(index)
+                continue
+
+            age = now - seconds
+
+            if self.newer is not None and age < self.newer:
+                kept.add(index)
+
+            if self.daily is not None:
+                if age < self.daily:
+                    kept.add(index)
+                else:
+                    # Oldest first, the last one standing is the latest
+                    days[stamp[:8]] = index
+
+        kept.update(days.itervalues())
+
+        return kept
+
+
+def _imprint_seconds(stamp):
+    """Seconds since epoch of imprint time `stamp`, or None"""
+    try:
+        return calendar.timegm(time.strptime(stamp, "%Y%m%d-%H%M%S"))
+    except ValueError:
+        return None
+
+
+def set_retention(location, retention):
+    """Retain imprints of histories within `location` by `retention`
+
+    Histories within `location`, including those of locations below
+    it without a retention of their own, are compacted by `retention`
+    upon being flushed, and by :func:`compact_history`.
+
+    Arguments:
+        location (Location or str): Location, or absolute path of it
+        retention (Retention): Retention of `location`, or None to
+            fall back to that of above hierarchy, or ultimately
+            `HISTORY_RETENTION`
+
+    """
+
+    path = _location_path(location).as_str
+
+    if retention is None:
+        _retentions.pop(path, None)
+    else:
+        _retentions[path] = retention
+
+
+def _retention_of(path):
+    """Retention applicable to absolute `path`, or None"""
+    if _retentions:
+        parent = path
+        while True:
+            if parent in _retentions:
+                return _retentions[parent]
+
+            parent, child = os.path.split(parent)
+            if not child:
+                break
+
+    return HISTORY_RETENTION
+
+
+def compact_history(root, retention=None, workers=None, imprinted=False):
+    """Remove imprints no longer retained, from every history below `root`
+
+    Both directory and journal histories are compacted, using
+    `workers` threads across containers. Histories are found by
+    walking `root` on disk, unless `imprinted`.
+
+    Example:
+        >>> import tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> location = Location(root)
+        >>> for value in range(4):
+        ...     _ = flush(Entry('height', value=value, parent=location),
+        ...               track_history='journal')
+        >>> compact_history(location, Retention(last=1))
+        2
+        >>> shutil.rmtree(root)
+
+    Arguments:
+        root (Location or str): Location, or absolute path of it
+        retention (Retention, optional): Retention of every history,
+            defaults to that of each, see :func:`set_retention`
+        workers (int, optional): Compact this many containers at once
+        imprinted (bool, optional): Only compact histories imprinted
+            by this process since last compacted, without walking `root`
+
+    Returns:
+        int: Number of imprints removed
+
+    """
+
+    path = _location_path(root).as_str
+
+    if imprinted:
+        _history_writer.join()
+        containers = [container for container in list(_imprinted)
+                      if container == path or util._within(container, path)]
+
+    else:
+        containers = list()
+        for dirpath, dirnames, _ in os.walk(path):
+            if lib.HISTORY in dirnames:
+                containers.append(dirpath)
+            dirnames[:] = [name for name in dirnames
+                           if name not in _hidden]
+
+    def compact(container):
+        return _compact(container, retention)
+
+    if workers and workers > 1 and len(containers) > 1:
+        pool = ThreadPool(min(workers, len(containers)))
+        try:
+            removed = pool.map(compact, containers)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        removed = map(compact, containers)
+
+    return sum(removed)
+
+
+def _compact(container, retention=None):
+    """Compact history of absolute `container`, in either store
+
+    Returns:
+        int: Number of imprints removed
+
+    """
+
+    retention = retention or _retention_of(container)
+    if retention is None:
+        return 0
+
+    _history_writer.join()
+    _imprinted.discard(container)
+
+    def retain(imprints):
+        kept = retention.select([imprint.time for imprint in imprints])
+        return [imprints[index] for index in kept]
+
+    removed = journal.Journal(container).compact(retain)
+
+    history = os.path.join(container, lib.HISTORY)
+    try:
+        names = os.listdir(history)
+    except OSError:
+        names = list()
+
+    imprints = dict()
+    for basename in sorted(names):
+        name, sep, stamp = basename.partition(lib.Path.QUERYSEP)
+        if not sep or not stamp.endswith('.dict'):
+            continue
+        imprints.setdefault(name, []).append(stamp[:-len('.dict')])
+
+    for name, times in imprints.iteritems():
+        kept = retention.select(times)
+        for index, stamp in enumerate(times):
+            if index in kept:
+                continue
+
+            _remove(os.path.join(history, "{name}{sep}{time}.dict".format(
+                name=name, sep=lib.Path.QUERYSEP, time=stamp)))
+            removed += 1
+
+    if removed:
+        log.info("_compact(): Removed %i imprints from %s"
+                 % (removed, container))
+
+    return removed
+
+
+class _Compactor(object):
+    """Compact histories on a thread of its own, see flush()"""
+
+    def __init__(self):
+        self._queue = Queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, container):
+        """Compact history of absolute `container`, unless already due"""
+        with self._lock:
+            if container in self._pending:
+                return
+            self._pending.add(container)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='openmetadata.compact')
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._queue.put(container)
+
+    def join(self):
+        """Block until every container submitted is compacted"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            container = self._queue.get()
+
+            with self._lock:
+                self._pending.discard(container)
+
+            try:
+                _compact(container)
+            except Exception:
+                log.exception("Could not compact %s" % container)
+            finally:
+                self._queue.task_done()
+
+
+_compactor = _Compactor()
+
+
+# ---------------------------------------------------------------------
+#
+# Cascading Metadata, RFC12
+# http://rfc.abstractfactory.io/spec/12
+#
+# ---------------------------------------------------------------------
+
+
+def inherit(resource, depth=0, merge=False, lazy=False, view=False,
+            cache=False):
+    """Inherit `resource` from above hierarchy
+
+    Inheritance works much like it does in programming; any value
+    present in a superclass is added, subclasses then overrides those
+    values.
+
+    The location of `resource` is itself part of the hierarchy, and
+    the closest; a value stored for `resource` there overrides those
+    of its parents.
+
+    Specification - http://rfc.abstractfactory.io/spec/12/
+
+    Parameters:
+        resource (str): Adding inherited values to this.
+        depth (int): How far up a hierarchy to inherit from, 0 means unlimited
+        merge (bool): Either keep current values and merge new, or clear first.
+        pull (bool): Not pulling will only fill up the mro (see RFC12)
+        lazy (bool): Should I bother reading when values already exists?
+        view (bool): Leave `resource` untouched and return a read-only
+            view of it layered over its parents, see :class:`lib.Layers`
+        cache (bool): Store the inherited tree of the location of
+            `resource` on disk, in `CACHE_DIR`, and re-use it for as
+            long as no container involved is modified.
+            See :func:`_cached_tree`
+
+    Raises:
+        ValueError: If caching without `CACHE_DIR` set
+
+    """
+
+    if view:
+        return _inherit_view(resource, depth)
+
+    if cache:
+        if CACHE_DIR is None:
+            raise ValueError("Set CACHE_DIR, or $OPENMETADATA_CACHE, "
+                             "to cache inherited trees")
+        return _inherit_cached(resource, depth, CACHE_DIR)
 
     if isinstance(resource, Location):
         return _inherit_location(resource, depth, merge, lazy)
@@ -515,84 +1826,71 @@ def _inherit_entry(resource, depth=0, merge=False, lazy=False):
     the hierarchy like for Location, but inheriting value means to fetch
     the closest value in the method-resolution-order.
 
-    TODO: At the moment, values are read from top-to-bottom even though
-        a great increase in performance and I/O could be made if it only
-        fetched the closest value; as advertised above. It is however, an
-        optimisation and thus delayed.
+    Locations are visited closest-first, starting at the location of
+    `resource`, such that inheriting a value stops at the first
+    location holding one. Children are merged from each location in
+    turn, up until an ancestor holding a value rather than children,
+    with closer children overriding those further up.
 
     """
 
-    tree = list()
-
-    parent = resource.location
-    while parent:
-        tree.insert(0, parent)
-        parent = parent.parent
+    if lazy and resource.has_value:
+        return resource
 
-    # Children overwrites parents
-    tree.reverse()
+    if not merge:
+        resource.clear()
 
-    parent = tree.pop()
     metapath = resource.path.meta
+    collection = False
 
-    while tree:
-        descendant = entry(parent, metapath.as_str)
+    for location in _lineage(resource.location, depth):
+        descendant = entry(location, metapath.as_str)
 
         try:
-            pull(descendant)
+            pull(descendant, hidden=False)
         except error.Exists:
-            pass
+            continue
 
-        else:
+        #  ___
+        # |___|___
+        # |       |\
+        # |         |
+        # |_________|
+        #     |    ___
+        #     |   |___|___
+        #     |___|       |\
+        #         |         |
+        #         |_________|
+        #
+        #  Add child to location
+        if descendant.type in ('dict', 'list'):
+            collection = True
+            _inherit_children(resource, descendant)
+
+        elif descendant.has_value:
             #  ___
             # |___|___
             # |       |\
-            # |         |
+            # |         |  <--- value
             # |_________|
-            #     |    ___
-            #     |   |___|___
-            #     |___|       |\
-            #         |         |
-            #         |_________|
             #
-            #  Add child to location
-            if descendant.type in ('dict', 'list'):
-                for child in descendant.children:
-                    resource.add(child)
-
-            else:
-                #  ___
-                # |___|___
-                # |       |\
-                # |         |  <--- value
-                # |_________|
-                #
-                value = descendant.value
-
-                if value:
-                    resource.value = value
-
-        parent = tree.pop()
+            # A value overrides any children further up, and
+            # is itself overridden by any children closer by.
+            if not collection:
+                resource.value = descendant.value
+            break
 
     return resource
 
 
 def _inherit_location(location, depth=0, merge=False, lazy=False):
-    tree = list()
+    """Inherit children of `location` from it and its parents
 
-    parent = location
-    while parent:
-        tree.insert(0, parent)
-        parent = parent.parent
+    Closer children override those further up.
 
-    # Children overwrites parents
-    tree.reverse()
+    """
 
-    # Assign inherited metadata in the order
-    # they naturally override each other.
-    # Overridden values will silently retreat
-    # back into the depths from which they came.
-    for location in tree:
+    for ancestor in _lineage(location, depth):
         #  ___
         # |___|___
         # |       |\
@@ -607,26 +1905,351 @@ def _inherit_location(location, depth=0, merge=False, lazy=False):
         #  Add child to location
 
         try:
-            pull(location)
+            pull(ancestor, merge=merge and ancestor is location,
+                 hidden=False)
         except error.Exists:
             pass
         else:
-            for entry in location:
-                location.add(entry)
+            if ancestor is not location:
+                _inherit_children(location, ancestor)
 
     return location
 
 
+def inherit_many(locations, metapaths, depth=0, workers=None):
+    """Inherit each of `metapaths` for each of `locations`
+
+    Locations commonly share ancestors, such as shots of a sequence.
+    Ancestors are gathered into a trie, such that each is pulled
+    only once, after which every pair of location and metapath is
+    resolved as per :func:`inherit` from the pulled ancestors.
+
+    Example:
+        >> values = inherit_many(['/shots/1000', '/shots/1010'],
+        ..                       ['apps/maya/version'])
+        >> values['/shots/1000', 'apps/maya/version']
+        2015
+
+    Arguments:
+        locations (list): Absolute paths or Location objects
+        metapaths (list): Metapaths to inherit within each location
+        depth (int): How far up a hierarchy to inherit from, 0 means unlimited
+        workers (int, optional): Pull ancestors using this many threads
+
+    Returns:
+        dict: Value per absolute path of location and metapath,
+            or None where no value was found.
+
+    """
+
+    metapaths = list(metapaths)
+
+    # Ancestors are stored per path, pointing to their parent.
+    # Branches shared with previous locations are not revisited.
+    trie = dict()
+    locations = [_location_path(location) for location in locations]
+
+    for path in locations:
+        while path and path.as_str not in trie:
+            parent = path.parent or None
+            trie[path.as_str] = parent
+            path = parent
+
+    ancestors = trie.keys()
+    if workers:
+        pool = ThreadPool(workers)
+        try:
+            pulled = pool.map(_pull_ancestor, ancestors)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        pulled = map(_pull_ancestor, ancestors)
+
+    pulled = dict(zip(ancestors, pulled))
+
+    values = dict()
+    for location in locations:
+        path = location
+        layers = list()
+        level = 0
+
+        while path:
+            layer = pulled[path.as_str]
+            if layer is not None:
+                layers.append(layer)
+
+            if depth and level >= depth:
+                break
+
+            level += 1
+            path = trie[path.as_str]
+
+        view = lib.Layers(layers, pull=_pull_layer)
+
+        for metapath in metapaths:
+            resource = view
+
+            try:
+                for part in util.parse_metapath(metapath):
+                    resource = resource[part.rsplit(lib.Path.EXT, 1)[0]]
+            except KeyError:
+                value = None
+            else:
+                value = resource.value
+
+            values[(location.as_str, metapath)] = value
+
+    return values
+
+
+def _location_path(location):
+    if isinstance(location, basestring):
+        location = Location(location)
+    return location._path
+
+
+def _pull_ancestor(path):
+    """Pull location at `path`, or None if it holds no metadata"""
+    location = Location(path)
+
+    try:
+        pull(location, defer=True, hidden=False)
+    except error.Exists:
+        return None
+
+    return location
+
+
+def _inherit_view(resource, depth=0):
+    """Layer `resource`, as stored, over its parents
+
+    Each layer is pulled separately and left as-is; layers above
+    the first value are never read. Values, and children beyond
+    the first level, are read upon first being accessed.
+
+    """
+
+    layers = list()
+
+    if isinstance(resource, Location):
+        for location in _lineage(Location(resource.path.location), depth):
+            try:
+                pull(location, defer=True, hidden=False)
+            except error.Exists:
+                continue
+            layers.append(location)
+
+    else:
+        metapath = resource.path.meta.as_str
+        for location in _lineage(resource.location, depth):
+            layer = entry(location, metapath)
+
+            try:
+                pull(layer, defer=True, hidden=False)
+            except error.Exists:
+                continue
+
+            if layer.type in ('dict', 'list'):
+                layers.append(layer)
+
+            elif layer.has_value:
+                layers.append(layer)
+                break
+
+    return lib.Layers(layers, pull=_pull_layer)
+
+
+def _pull_layer(resource):
+    try:
+        pull(resource, defer=True, hidden=False)
+    except error.Exists:
+        pass
+
+
+def _inherit_cached(resource, depth, directory):
+    """Inherit `resource` from the cached tree of its location"""
+    if isinstance(resource, Location):
+        tree = _cached_tree(resource, depth, directory)
+        _populate(resource, tree)
+        return resource
+
+    tree = _cached_tree(resource.location, depth, directory)
+
+    basename, payload = None, tree
+    for part in util.parse_metapath(resource.path.meta.as_str):
+        try:
+            basename, payload = payload[part.rsplit(lib.Path.EXT, 1)[0]]
+        except (KeyError, TypeError):
+            return resource
+
+    if isinstance(payload, dict):
+        _populate(resource, payload)
+    else:
+        try:
+            _assign_serialised(resource, lib.Path(basename).suffix, payload)
+        except ValueError:
+            pass
+
+    return resource
+
+
+def _cached_tree(location, depth, directory):
+    """Return inherited tree of `location`, from cache if still valid
+
+    The tree is stored per location and depth, alongside the
+    modification time of each container it was inherited from. The
+    cache is valid for as long as these are unchanged, costing one
+    stat per ancestor. Flushing touches each container modified, see
+    :func:`_plan_flush`; changes made by other means may go unnoticed.
+    As with listings, see :func:`util.listdir`, trees stored within
+    `util._RACY` seconds of a modification are never trusted.
+
+    Trees map names to pairs of (basename, payload), where the payload
+    is either a tree of its own, or the value as serialised on disk.
+
+    """
+
+    now = time.time()
+
+    stamps = list()
+    for ancestor in _lineage(location, depth):
+        container = ancestor.path.as_str
+        try:
+            stamps.append((container, os.stat(container).st_mtime))
+        except OSError:
+            continue
+
+    key = '%s?depth=%i' % (location.path.as_str, depth)
+    path = os.path.join(directory, hashlib.sha1(key).hexdigest())
+
+    try:
+        with open(path, 'rb') as f:
+            cached_key, cached_stamps, stored, tree = cPickle.load(f)
+    except Exception:
+        # Missing, truncated or otherwise unreadable; start over
+        pass
+    else:
+        # Containers modified within the same tick of the file-system
+        # clock as the tree was stored may since have been modified
+        # again, without their modification time having changed.
+        if (cached_key == key and cached_stamps == stamps and
+                all(stored - mtime > util._RACY
+                    for _, mtime in stamps)):
+            return tree
+
+    tree = _flatten(_inherit_view(location, depth))
+
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    # Written to a temporary file first, such that concurrent
+    # readers never see a partially written tree.
+    fd, temp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        cPickle.dump((key, stamps, now, tree), f, cPickle.HIGHEST_PROTOCOL)
+
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+    return tree
+
+
+def _flatten(view):
+    """Resolve `view` into a tree, see :func:`_cached_tree`"""
+    tree = dict()
+
+    for child in view:
+        if isinstance(child, lib.Layers):
+            payload = _flatten(child)
+        else:
+            try:
+                payload = _read(child.path.as_str)
+            except error.Exists:
+                continue
+
+        tree[child.name] = (child.path.basename, payload)
+
+    return tree
+
+
+def _populate(resource, tree):
+    """Add children of `tree` not already present in `resource`"""
+    for name, (basename, payload) in tree.iteritems():
+        try:
+            resource[name]
+            continue
+        except KeyError:
+            child = Entry(basename, parent=resource)
+
+        if isinstance(payload, dict):
+            _populate(child, payload)
+        elif payload != "":
+            child.load(payload)
+
+
+def _assign_serialised(resource, suffix, data):
+    """Assign serialised `data` of `suffix` to `resource`, as-is
+
+    As opposed to assigning a decoded value, the suffix is kept
+    rather than derived anew from the type of the value.
+
+    Raises:
+        ValueError: If `data` is not a valid serialisation
+
+    """
+
+    if suffix and suffix != resource.type:
+        resource._path = resource._path.copy(suffix=suffix)
+        resource._invalidate()
+
+    codec = lib.get_codec(resource.type)
+    if data == "":
+        resource._assign(None)
+    else:
+        resource._assign(codec.decode(data), encoded=data, codec=codec)
+
+
+def _lineage(location, depth=0):
+    """Yield `location` followed by its parents, closest first
+
+    Arguments:
+        location (Location): Location from which to start
+        depth (int): Number of parents to yield, 0 means unlimited
+
+    """
+
+    level = 0
+    while location:
+        yield location
+
+        if depth and level >= depth:
+            break
+
+        level += 1
+        location = location.parent
+
+
+def _inherit_children(resource, ancestor):
+    """Add children of `ancestor` not already present in `resource`"""
+    for child in list(ancestor.children):
+        try:
+            resource[child.name]
+        except KeyError:
+            resource.add(child)
+
+
 def _inherit_value():
     """TODO: transition from inheriting location versus entries to
         inhertiing values versus children, as it more closely relates
         to the differences between the two"""
 
 
-def _inherit_children():
-    pass
-
-
 # ---------------------------------------------------------------------
 #
 # Convenience functions
@@ -737,6 +2360,15 @@ def entry(location, metapath):
 
     Supports inputs as either string or native Location and Path objects.
 
+    Each level of `metapath` is resolved against disk by listing its
+    parent once, with levels below a missing one not looked up at all.
+    Only the entries along `metapath` are created, not their siblings,
+    and no values are read.
+
+    Only the suffix of the last level, if given, must match what is on
+    disk; suffixes of the levels above it are ignored, such that
+    "apps.dict/maya" and "apps.list/maya" resolve alike.
+
     Arguments:
         location (str): Location in which entry resides
         metapath (str): Metapath which to convert into Entry
@@ -746,7 +2378,6 @@ def entry(location, metapath):
 
     """
 
-
     if isinstance(location, basestring):
         location = Location(location)
 
@@ -756,38 +2387,67 @@ def entry(location, metapath):
     assert metapath
 
     root = location
-    parts = metapath.parts
+    dirty = location.isdirty
+    chain = list()
+    exists = True
 
-    while parts:
-        try:
-            pull(root)
-        except error.Exists:
-            pass
+    parts = [part for part in metapath.parts if part]
 
-        current = parts.pop(0)
-        while not current:
-            current = parts.pop(0)
+    for level, current in enumerate(parts, 1):
+        basename = None
+        if exists:
+            basename = _probe(root.path.as_str, current,
+                              strict=level == len(parts))
 
-        # Remove suffix for query
-        try:
-            name, suffix = current.rsplit(lib.Path.EXT, 1)
-        except ValueError:
-            name, suffix = current, None
+        if basename is None:
+            exists = False
+            basename = current
+
+        root = lib.Entry(basename, parent=root)
+        chain.append(root)
+
+    # Entries found on disk are as clean as though they were pulled
+    if exists:
+        for resource in chain:
+            resource.isdirty = False
+        location.isdirty = dirty
+
+    return root
 
+
+def _probe(path, basename, strict=True):
+    """Return basename of entry in `path` matching `basename`
+
+    Suffix is ignored, unless included in `basename` and `strict`.
+    Entries matching in case are preferred over those which don't.
+
+    Returns:
+        str: Basename of match, or None
+
+    """
+
+    if basename.startswith('.'):
+        name, suffix = basename, None
+    else:
         try:
-            new_root = root[name]
+            name, suffix = basename.rsplit(lib.Path.EXT, 1)
+        except ValueError:
+            name, suffix = basename, None
 
-            # If metapath included a suffix,
-            # ensure the child we fetch match this suffix.
-            if suffix and new_root.path.suffix != suffix:
-                raise KeyError
+    listing = util.index(path)
+    if not listing:
+        return None
 
-            root = new_root
+    candidates = listing.get(name.lower(), [])
+    if suffix and strict:
+        candidates = [candidate for candidate in candidates
+                      if candidate.rsplit(lib.Path.EXT, 1)[-1] == suffix]
 
-        except KeyError:
-            root = lib.Entry(current, parent=root)
+    for candidate in candidates:
+        if candidate == basename or candidate.startswith(name + lib.Path.EXT):
+            return candidate
 
-    return root
+    return candidates[0] if candidates else None
 
 
 def write(path, metapath, value=None):
@@ -0,0 +1,316 @@
+"""
+
+This module provides benchmarks for the performance-sensitive
+parts of Open Metadata.
+
+Each benchmark prints its timings and returns them as a dict,
+run them all via:
+
+    $ python -m openmetadata.examples.performance
+
+"""
+
+import os
+import gc
+import sys
+import time
+import shutil
+import timeit
+import tempfile
+
+import openmetadata as om
+
+
+def _chain(depth):
+    """Return leaf of a hierarchy `depth` entries deep"""
+    parent = om.Location(tempfile.gettempdir())
+    for level in range(depth):
+        parent = om.Entry('level%i' % level, parent=parent)
+    return om.Entry('leaf', value=5, parent=parent)
+
+
+def benchmark_path_access(depths=(10, 50), number=10000):
+    """Cost of accessing attributes derived from the absolute path"""
+    results = dict()
+
+    for depth in depths:
+        leaf = _chain(depth)
+
+        for attribute in ('path', 'type'):
+            timer = timeit.Timer(lambda: getattr(leaf, attribute))
+            seconds = min(timer.repeat(3, number)) / number
+            results[(depth, attribute)] = seconds
+
+            print "depth=%-3i %-6s %8.2f us" % (depth, attribute,
+                                                seconds * 1e6)
+
+    return results
+
+
+def _sizeof(obj):
+    """Size of `obj`, including its instance dictionary, if any"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def benchmark_path_memory(count=100000):
+    """Bytes per path, and cost of name/suffix, for a crawl of `count`"""
+    paths = [om.Path('/projects/show/shot%i/.meta/key%i.string'
+                     % (index / 100, index))
+             for index in range(count)]
+
+    for path in paths:
+        path.name, path.suffix, path.parent
+
+    size = sum(_sizeof(path) for path in paths) / float(count)
+    print "%.1f bytes per path" % size
+
+    path = paths[-1]
+    results = {'bytes': size}
+    for attribute in ('name', 'suffix', 'basename'):
+        timer = timeit.Timer(lambda: getattr(path, attribute))
+        seconds = min(timer.repeat(3, 10000)) / 10000
+        results[attribute] = seconds
+        print "%-8s %8.2f us" % (attribute, seconds * 1e6)
+
+    return results
+
+
+def _entry_size(entry):
+    return (_sizeof(entry) +
+            sys.getsizeof(entry._children) +
+            _sizeof(entry._path))
+
+
+def benchmark_entry_memory(count=100000):
+    """Bytes per entry of a tree, and objects left for the GC"""
+    location = om.Location(tempfile.gettempdir())
+    for index in range(count):
+        om.Entry('key%i' % index, value=index, parent=location)
+
+    size = sum(_entry_size(entry) for entry in location) / float(count)
+    print "%.1f bytes per entry" % size
+
+    gc.collect()
+    gc.disable()
+    try:
+        del location
+        unreachable = gc.collect()
+    finally:
+        gc.enable()
+
+    print "%i objects left for the cycle collector" % unreachable
+
+    return {'bytes': size, 'unreachable': unreachable}
+
+
+def benchmark_encode(size=1024 * 1024, number=10):
+    """Cost of assigning, loading and dumping values of `size` bytes"""
+    value = range(size / 8)
+    encoded = om.lib.json.dumps(value)
+    print "%i bytes encoded" % len(encoded)
+
+    entry = om.Entry('large.list')
+
+    def assign():
+        entry.value = value
+        entry.dump()
+
+    def load():
+        entry.load(encoded)
+        entry.dump()
+
+    results = dict()
+    for name, function in (('assign+dump', assign), ('load+dump', load)):
+        seconds = min(timeit.Timer(function).repeat(3, number)) / number
+        results[name] = seconds
+        print "%-12s %8.2f ms" % (name, seconds * 1e3)
+
+    return results
+
+
+def benchmark_codecs(number=100000):
+    """Decode throughput of each codec, per suffix"""
+    lib = om.lib
+    samples = (
+        ('string', u'The quick brown fox jumps over the lazy dog', lib.TEXT),
+        ('int', 1001, lib.INT),
+        ('float', 23.976, lib.FLOAT),
+    )
+
+    results = dict()
+    for suffix, value, codec in samples:
+        for name, candidate in (('json', lib.JSON),
+                                (type(codec).__name__, codec)):
+            data = candidate.encode(value)
+            timer = timeit.Timer(lambda: candidate.decode(data))
+            seconds = min(timer.repeat(3, number))
+            results[(suffix, name)] = number / seconds
+            print "%-6s %-12s %12.0f decodes/s" % (suffix, name,
+                                                   number / seconds)
+
+    return results
+
+
+def _count_io(function):
+    """Number of listings and reads performed by `function`"""
+    api, util = om.api, om.util
+    counts = {'list': 0, 'read': 0}
+    original = util._list
+
+    def list_(path):
+        counts['list'] += 1
+        return original(path)
+
+    def read(path, *args):
+        counts['read'] += 1
+        return open(path, *args)
+
+    util._list, api.open = list_, read
+    try:
+        function()
+    finally:
+        util._list = original
+        del api.open
+
+    return counts
+
+
+def _inherit_topdown(resource):
+    """Former strategy; visit every ancestor, root first"""
+    metapath = resource.path.meta.as_str
+    for location in reversed(list(om.api._lineage(resource.location))):
+        descendant = om.entry(location, metapath)
+        try:
+            om.pull(descendant)
+        except om.error.Exists:
+            continue
+        if descendant.value:
+            resource.value = descendant.value
+
+
+def benchmark_inherit_io(depth=5):
+    """Listings and reads per inherited value, `depth` levels deep"""
+    root = tempfile.mkdtemp()
+    try:
+        path = root
+        for level in range(depth):
+            path = os.path.join(path, 'level%i' % level)
+            location = om.Location(path)
+            om.Entry('height', value=level, parent=location)
+            om.flush(location)
+
+        results = dict()
+        for name, strategy in (('top-down', _inherit_topdown),
+                               ('closest-first', om.inherit)):
+            height = om.entry(path, 'height')
+            counts = _count_io(lambda: strategy(height))
+            assert height.value == depth - 1
+            results[name] = counts
+            print "%-14s %3i listings %3i reads" % (
+                name, counts['list'], counts['read'])
+    finally:
+        shutil.rmtree(root)
+
+    return results
+
+
+def _with_latency(function, latency):
+    """Call `function`, delaying each listing and read by `latency`"""
+    api, util = om.api, om.util
+    original = util._list
+
+    def list_(path):
+        time.sleep(latency)
+        return original(path)
+
+    def read(path, *args):
+        time.sleep(latency)
+        return open(path, *args)
+
+    util._list, api.open = list_, read
+    try:
+        return function()
+    finally:
+        util._list = original
+        del api.open
+
+
+def benchmark_pull_workers(groups=10, entries=50, latency=0.002,
+                           workers=(1, 4, 16)):
+    """Pulling a tree of `groups` * `entries` values at `latency`"""
+    root = tempfile.mkdtemp()
+    try:
+        location = om.Location(root)
+        for group in range(groups):
+            group = om.Entry('group%i' % group, parent=location)
+            for index in range(entries):
+                om.Entry('key%i' % index, value=index, parent=group)
+        om.flush(location)
+
+        results = dict()
+        for count in workers:
+            om.util.invalidate()
+            start = time.time()
+            _with_latency(lambda: om.pull(om.Location(root),
+                                          depth=3,
+                                          workers=count), latency)
+            seconds = time.time() - start
+            results[count] = seconds
+            print "workers=%-3i %8.2f s" % (count, seconds)
+    finally:
+        shutil.rmtree(root)
+
+    return results
+
+
+def benchmark_history_delta(lines=2000, edits=50):
+    """Journal size and reconstruction of `edits` to text of `lines`"""
+    results = dict()
+    for delta in (False, True):
+        text = [u'Line %i of a lengthy description\n' % index
+                for index in range(lines)]
+
+        root = tempfile.mkdtemp()
+        om.api.HISTORY_DELTA = delta
+        try:
+            location = om.Location(root)
+            entry = om.Entry('description.text', value=u''.join(text),
+                             parent=location)
+            om.flush(location)
+
+            for edit in range(edits):
+                text[edit * lines / edits] = u'Edit %i\n' % edit
+                entry.value = u''.join(text)
+                om.flush(entry, track_history='journal')
+
+            history = om.journal.Journal(location.path.as_str)
+            size = os.path.getsize(history.path)
+
+            imprints = history.imprints()
+            start = time.time()
+            for imprint in imprints:
+                history.read(imprint)
+            seconds = (time.time() - start) / len(imprints)
+
+            results[delta] = {'bytes': size, 'read': seconds}
+            print "delta=%-5s %10i bytes %8.2f ms per imprint" % (
+                delta, size, seconds * 1e3)
+        finally:
+            om.api.HISTORY_DELTA = False
+            shutil.rmtree(root)
+
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_path_access()
+    benchmark_path_memory()
+    benchmark_entry_memory()
+    benchmark_encode()
+    benchmark_codecs()
+    benchmark_inherit_io()
+    benchmark_pull_workers()
+    benchmark_history_delta()
@@ -0,0 +1,765 @@
+"""Append-only history of a container
+
+Imprints (see RFC12) of each entry within a container are appended as
+records to a single file, rather than stored as a directory each. An
+index of offsets alongside locates imprints without reading the
+journal itself.
+
+    .meta
+    |-- .history
+    |   |-- journal
+    |   |-- journal.idx
+    |-- height.int
+
+Records are laid out as:
+
+    length (uint32) | crc32 (uint32) | header (JSON) \\n value
+
+Where the header holds name, suffix, time and user of the imprint, and
+value is the previous value exactly as it was serialised on disk. Each
+line of the index holds name, suffix, time, offset and length of a
+record, separated by tabs, in the order in which they were appended.
+
+Records of text may instead hold a delta of lines against the previous
+record of their entry, see Journal.append(), with a full copy at least
+every `SNAPSHOT_INTERVAL` records. Their header then holds the offset
+of that record, as "base", and their value holds runs of lines of the
+base to replace, as:
+
+    start end length \n replacement
+
+A record is appended to the journal before being indexed; should a
+process die in between, the index is recovered from the journal, and a
+partially written record is discarded, upon the next append. Compacting
+replaces the journal, followed by its index.
+
+Attributes:
+    JOURNAL: Name of journal, within the history of a container
+    INDEX: Name of index, alongside the journal
+    DELTA_SUFFIXES: Suffixes of values which may be stored as deltas
+    SNAPSHOT_INTERVAL: Deltas between full copies, at most
+    CACHE_SIZE: Journals of which to remember imprints, at most
+
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import difflib
+import errno
+import bisect
+import struct
+import tempfile
+import threading
+import contextlib
+import collections
+
+try:
+    import fcntl
+except ImportError:
+    # Appends are only serialised within this process
+    fcntl = None
+
+from openmetadata import lib
+from openmetadata import error
+
+JOURNAL = 'journal'
+INDEX = 'journal.idx'
+
+DELTA_SUFFIXES = ('text', 'string')
+SNAPSHOT_INTERVAL = 16
+CACHE_SIZE = 256
+
+# Lines of text, whether serialised raw or quoted as JSON; tokens
+# need only add up to what was serialised, not be exact lines.
+_token = re.compile(r'.*?(?:\n|\\n)|.+', re.S)
+
+_record = struct.Struct('<II')
+_lock = threading.Lock()
+
+# Imprints of each journal sorted by name and time, see between()
+_sorted = collections.OrderedDict()
+
+# Offset of the latest record of each entry, of each journal as last
+# appended to or compacted by this process, see append()
+_tails = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Imprint(object):
+    """Previous value of an entry, as recorded in a :class:`Journal`
+
+    Only the whereabouts of an imprint are held in memory, its user
+    and value are read from the journal upon first being accessed.
+
+    Attributes:
+        name: Name of entry, excluding suffix
+        suffix: Suffix of entry at the time, or None
+        time: Time of imprint, as per lib._currenttime()
+
+    """
+
+    __slots__ = ('journal', 'name', 'suffix', 'time', 'offset', 'length',
+                 '_header', '_data')
+
+    def __init__(self, journal, name, suffix, time, offset, length):
+        self.journal = journal
+        self.name = name
+        self.suffix = suffix
+        self.time = time
+        self.offset = offset
+        self.length = length
+        self._header = None
+        self._data = None
+
+    def __repr__(self):
+        return "%s.%s(%r, %r)" % (__name__, type(self).__name__,
+                                  self.basename, self.time)
+
+    @property
+    def basename(self):
+        if self.suffix:
+            return self.name + lib.Path.EXT + self.suffix
+        return self.name
+
+    @property
+    def end(self):
+        return self.offset + self.length
+
+    @property
+    def user(self):
+        self._read()
+        return self._header.get('user')
+
+    @property
+    def data(self):
+        """Value, as serialised on disk"""
+        self._read()
+        return self._data
+
+    @property
+    def value(self):
+        data = self.data
+        if data == "":
+            return None
+        return lib.get_codec(self.suffix).decode(data)
+
+    def _read(self):
+        if self._data is None:
+            self._header, self._data = self.journal.read(self)
+
+
+class Journal(object):
+    """History of every entry within a container
+
+    Arguments:
+        directory (str): Absolute path of container, such as the
+            .meta directory of a location, or a collection within it
+
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, lib.HISTORY)
+        self.path = os.path.join(self.directory, JOURNAL)
+        self.index_path = os.path.join(self.directory, INDEX)
+
+    def __repr__(self):
+        return "%s.%s(%r)" % (__name__, type(self).__name__, self.path)
+
+    def append(self, name, suffix, data, user, time, delta=False):
+        """Append imprint of `data` to journal
+
+        Arguments:
+            name (str): Name of entry, excluding suffix
+            suffix (str): Suffix of entry, or None
+            data (str): Value, as serialised on disk
+            user (str): Name of user making the imprint
+            time (str): Time of imprint, as per lib._currenttime()
+            delta (bool, optional): Store `data` as a delta against
+                the previous imprint of `name`, if of the same suffix,
+                one of `DELTA_SUFFIXES` and smaller than `data`. Only
+                imprints appended by this process since the journal
+                was last changed by another serve as base, such that
+                the index need not be read; else a full copy is stored.
+
+        Returns:
+            Imprint: The appended imprint
+
+        """
+
+        header = {'name': name,
+                  'suffix': suffix,
+                  'time': time,
+                  'user': user}
+        data = str(data)
+
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        with self._locked() as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+
+            # Unchanged since last appended to by this process
+            cached = _recall(_tails, self.path)
+            if cached is not None and cached[0] == self._revision():
+                end, latest = size, cached[1]
+            else:
+                end, latest = self._recover(size), dict()
+
+            previous = None
+            if delta and suffix in DELTA_SUFFIXES:
+                previous = latest.get(name)
+
+            value = data
+            if previous is not None:
+                with open(self.path, 'rb') as source:
+                    value = _delta(header, data, previous,
+                                   *self._resolve(source, previous))
+
+            record = _pack(header, value)
+            imprint = Imprint(self, name, suffix, time, end, len(record))
+
+            f.write(record)
+            f.flush()
+            self._index([imprint])
+
+            latest[name] = imprint.offset
+            _remember(_tails, self.path, (self._revision(), latest))
+
+        return imprint
+
+    def compact(self, retain):
+        """Remove imprints not retained by `retain`
+
+        The journal is rewritten with only the imprints retained, and
+        replaced along with its index, whilst appends are held off.
+
+        Arguments:
+            retain (callable): Called with the imprints of each entry,
+                oldest first, returning those to keep
+
+        Returns:
+            int: Number of imprints removed
+
+        """
+
+        if not os.path.exists(self.path):
+            return 0
+
+        with self._locked() as f:
+            f.seek(0, os.SEEK_END)
+            self._recover(f.tell())
+
+            imprints = self._indexed()
+
+            entries = dict()
+            for imprint in imprints:
+                entries.setdefault(imprint.name, []).append(imprint)
+
+            kept = set()
+            for entry_imprints in entries.itervalues():
+                kept.update(id(imprint)
+                            for imprint in retain(entry_imprints))
+
+            if len(kept) == len(imprints):
+                return 0
+
+            # Left behind by a compaction which did not finish
+            for basename in os.listdir(self.directory):
+                if basename.startswith(lib.TEMP):
+                    try:
+                        os.remove(os.path.join(self.directory, basename))
+                    except OSError:
+                        pass
+
+            compacted = list()
+            journal_fd, journal_temp = tempfile.mkstemp(prefix=lib.TEMP,
+                                                        dir=self.directory)
+            index_fd, index_temp = tempfile.mkstemp(prefix=lib.TEMP,
+                                                    dir=self.directory)
+
+            # Latest record of each entry, as written to the
+            # compacted journal, against which to encode deltas.
+            latest = dict()
+
+            with open(self.path, 'rb') as source:
+                with os.fdopen(journal_fd, 'wb') as target:
+                    for imprint in imprints:
+                        if id(imprint) not in kept:
+                            continue
+
+                        offset = target.tell()
+                        header, data, depth = self._resolve(source,
+                                                            imprint.offset)
+
+                        if depth:
+                            # Its base may be gone, or have moved
+                            header.pop('base', None)
+                            header.pop('depth', None)
+
+                            value = data
+                            if imprint.name in latest:
+                                value = _delta(header, data,
+                                               *latest[imprint.name])
+
+                            record = _pack(header, value)
+
+                        else:
+                            source.seek(imprint.offset)
+                            record = source.read(imprint.length)
+
+                        target.write(record)
+
+                        latest[imprint.name] = (offset, header, data,
+                                                header.get('depth', 0))
+
+                        compacted.append(Imprint(self,
+                                                 imprint.name,
+                                                 imprint.suffix,
+                                                 imprint.time,
+                                                 offset,
+                                                 len(record)))
+
+            os.close(index_fd)
+            self._index(compacted, path=index_temp)
+
+            # An index outliving its journal is
+            # discarded upon reading, see imprints()
+            _replace(journal_temp, self.path)
+            _replace(index_temp, self.index_path)
+
+            _remember(_tails, self.path,
+                      (self._revision(),
+                       dict((name, record[0])
+                            for name, record in latest.iteritems())))
+
+        return len(imprints) - len(compacted)
+
+    def imprints(self, name=None):
+        """Return imprints, in the order in which they were appended
+
+        Arguments:
+            name (str, optional): Only return imprints of this entry
+
+        """
+
+        imprints = self._indexed()
+
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return list()
+
+        end = imprints[-1].end if imprints else 0
+        if end > size:
+            # Index is ahead of a journal which has been replaced
+            imprints, end = list(), 0
+
+        if end < size:
+            imprints.extend(self._scan(end, size)[0])
+
+        if name is not None:
+            imprints = [imprint for imprint in imprints
+                        if imprint.name == name]
+
+        return imprints
+
+    def between(self, name, since=None, until=None):
+        """Return imprints of `name` from `since` until `until`, oldest first
+
+        Imprints are sorted by name and time once per revision of
+        the journal, after which each query is a binary search.
+
+        Arguments:
+            name (str): Name of entry, excluding suffix
+            since (str, optional): Earliest time, inclusive
+            until (str, optional): Latest time, inclusive
+
+        """
+
+        keys, imprints = self._sorted()
+
+        lower = bisect.bisect_left(keys, (name, since or ''))
+        upper = bisect.bisect_right(keys, (name, until or '~', sys.maxint))
+
+        return imprints[lower:upper]
+
+    def read(self, imprint):
+        """Return header and serialised value of `imprint`
+
+        Values stored as deltas are reconstructed from the full
+        copy preceding them, reading each record in between.
+
+        """
+
+        with open(self.path, 'rb') as f:
+            header, data, _ = self._resolve(f, imprint.offset,
+                                            imprint.length)
+
+        return header, data
+
+    def _resolve(self, f, offset, length=None):
+        """Return header, serialised value and depth of record at `offset`
+
+        Where depth is the number of deltas applied.
+
+        """
+
+        header, value = self._read_record(f, offset, length)
+
+        deltas = list()
+        base = header
+        while 'base' in base:
+            deltas.append(value)
+            base, value = self._read_record(f, base['base'])
+
+        if deltas:
+            # Patched as lines, joined once
+            lines = _token.findall(value)
+            for delta in reversed(deltas):
+                lines = _patch(lines, delta)
+            value = ''.join(lines)
+
+        return header, value, len(deltas)
+
+    def _read_record(self, f, offset, length=None):
+        """Return header and value of record at `offset`"""
+        f.seek(offset)
+        prefix = f.read(_record.size)
+
+        payload = None
+        if len(prefix) == _record.size:
+            size, crc = _record.unpack(prefix)
+            payload = f.read(size)
+
+            if (len(payload) != size or
+                    zlib.crc32(payload) & 0xffffffff != crc or
+                    length not in (None, _record.size + size)):
+                payload = None
+
+        if payload is None:
+            raise error.Corrupt("Imprint at %i of %s is corrupt"
+                                % (offset, self.path))
+
+        header, value = payload.split('\n', 1)
+        return json.loads(header), value
+
+    def _indexed(self):
+        """Return imprints listed in the index"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                lines = f.read().splitlines()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return list()
+            raise
+
+        imprints = list()
+        for line in lines:
+            try:
+                name, suffix, time, offset, length = line.split('\t')
+                imprint = Imprint(self, name, suffix or None, time,
+                                  int(offset), int(length))
+            except ValueError:
+                # Partially written line
+                break
+
+            imprints.append(imprint)
+
+        return imprints
+
+    def _revision(self):
+        """Return inode and size of journal, and size of index
+
+        Returns:
+            tuple: Revision, or None if there is no journal
+
+        """
+
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        try:
+            indexed = os.path.getsize(self.index_path)
+        except OSError:
+            indexed = 0
+
+        return stat.st_ino, stat.st_size, indexed
+
+    def _sorted(self):
+        """Return sort keys and imprints, sorted by name and time"""
+        revision = self._revision()
+        if revision is None:
+            return list(), list()
+
+        cached = _recall(_sorted, self.path)
+        if cached is not None and cached[0] == revision:
+            return cached[1:]
+
+        # Order of appending breaks ties within the same second
+        imprints = self.imprints()
+        order = sorted(range(len(imprints)),
+                       key=lambda index: (imprints[index].name,
+                                          imprints[index].time,
+                                          index))
+
+        keys = [(imprints[index].name, imprints[index].time, index)
+                for index in order]
+        imprints = [imprints[index] for index in order]
+
+        _remember(_sorted, self.path, (revision, keys, imprints))
+
+        return keys, imprints
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Open journal for appending, held off from other writers"""
+        with _lock:
+            while True:
+                f = open(self.path, 'ab')
+
+                if fcntl is None:
+                    break
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+
+                # The journal may have been replaced by a
+                # compaction, whilst waiting for the lock.
+                try:
+                    if os.fstat(f.fileno()).st_ino == \
+                            os.stat(self.path).st_ino:
+                        break
+                except OSError:
+                    pass
+
+                f.close()
+
+            try:
+                yield f
+            finally:
+                f.close()
+
+    def _index(self, imprints, path=None):
+        with open(path or self.index_path, 'ab') as f:
+            for imprint in imprints:
+                f.write('%s\t%s\t%s\t%i\t%i\n' % (imprint.name,
+                                                  imprint.suffix or '',
+                                                  imprint.time,
+                                                  imprint.offset,
+                                                  imprint.length))
+
+    def _recover(self, size):
+        """Bring index up to date with journal of `size` bytes
+
+        Records appended but not indexed are indexed, and a partially
+        written record is truncated, such that the next record is
+        appended directly after the last intact record.
+
+        Returns:
+            int: Offset at which to append
+
+        """
+
+        end = self._indexed_end()
+
+        if end > size:
+            # Index is ahead of a journal which has been replaced
+            with open(self.index_path, 'wb'):
+                pass
+            end = 0
+
+        if end < size:
+            recovered, end = self._scan(end, size)
+            self._index(recovered)
+
+            if end < size:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(end)
+
+        return end
+
+    def _indexed_end(self):
+        """Return offset past the last record listed in the index
+
+        Only the end of the index is read. A partially written last
+        line is truncated, and an index whose last line cannot be
+        parsed is emptied, to be rebuilt from the journal.
+
+        """
+
+        try:
+            f = open(self.index_path, 'r+b')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return 0
+            raise
+
+        with f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            chunk = ''
+
+            # Read backwards until the last complete line is whole
+            while True:
+                step = min(offset, 4096)
+                offset -= step
+                f.seek(offset)
+                chunk = f.read(step) + chunk
+
+                last = chunk.rfind('\n')
+                if offset == 0 or (last > 0 and
+                                   chunk.rfind('\n', 0, last) != -1):
+                    break
+
+            if last + 1 < len(chunk):
+                # Partially written line
+                f.truncate(offset + last + 1)
+
+            if last == -1:
+                return 0
+
+            line = chunk[chunk.rfind('\n', 0, last) + 1:last]
+
+            try:
+                _, _, _, start, length = line.split('\t')
+                return int(start) + int(length)
+            except ValueError:
+                f.truncate(0)
+                return 0
+
+    def _scan(self, offset, size):
+        """Read intact records of the journal from `offset`
+
+        Returns:
+            tuple: Imprints found, and offset past the last one
+
+        """
+
+        imprints = list()
+
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+
+            while offset + _record.size <= size:
+                length, crc = _record.unpack(f.read(_record.size))
+                if offset + _record.size + length > size:
+                    break
+
+                payload = f.read(length)
+                if zlib.crc32(payload) & 0xffffffff != crc:
+                    break
+
+                header = json.loads(payload.split('\n', 1)[0])
+                imprints.append(Imprint(self,
+                                        header['name'],
+                                        header['suffix'],
+                                        header['time'],
+                                        offset,
+                                        _record.size + length))
+
+                offset += _record.size + length
+
+        return imprints, offset
+
+
+def _recall(cache, key):
+    """Return value of `key` in `cache`, or None"""
+    with _cache_lock:
+        value = cache.pop(key, None)
+        if value is not None:
+            cache[key] = value
+        return value
+
+
+def _remember(cache, key, value):
+    """Store `value` in `cache`, forgetting the least recently used"""
+    with _cache_lock:
+        cache.pop(key, None)
+        if len(cache) >= CACHE_SIZE:
+            cache.popitem(last=False)
+
+        # Most recently used are kept last
+        cache[key] = value
+
+
+def _replace(source, target):
+    if os.name == 'nt' and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+def _pack(header, value):
+    """Return record of `header` and `value`"""
+    payload = json.dumps(header) + '\n' + value
+    return _record.pack(len(payload),
+                        zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def _delta(header, data, offset, base_header, base, depth):
+    """Return value of record holding `data`, against the record at `offset`
+
+    The delta is only used, and `header` updated to refer to its base,
+    when smaller than `data` and less than `SNAPSHOT_INTERVAL` deltas
+    away from a full copy.
+
+    Arguments:
+        header (dict): Header of the record to be
+        data (str): Value to store
+        offset (int): Offset of the previous record of the entry
+        base_header (dict): Header of the previous record
+        base (str): Serialised value of the previous record
+        depth (int): Deltas between the previous record and a full copy
+
+    """
+
+    if depth >= SNAPSHOT_INTERVAL or \
+            base_header.get('suffix') != header['suffix']:
+        return data
+
+    old, new = _token.findall(base), _token.findall(data)
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+
+    runs = list()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+
+        replacement = ''.join(new[j1:j2])
+        runs.append('%i %i %i\n%s' % (i1, i2, len(replacement), replacement))
+
+    delta = ''.join(runs)
+    if len(delta) >= len(data):
+        return data
+
+    header['base'] = offset
+    header['depth'] = depth + 1
+
+    return delta
+
+
+def _patch(lines, delta):
+    """Apply `delta` to `lines` of a serialised value, see _delta()"""
+    patched = list()
+    position = offset = 0
+    while offset < len(delta):
+        newline = delta.index('\n', offset)
+        start, end, length = map(int, delta[offset:newline].split())
+
+        patched.extend(lines[position:start])
+        patched.extend(_token.findall(delta[newline + 1:
+                                            newline + 1 + length]))
+
+        position = end
+        offset = newline + 1 + length
+
+    patched.extend(lines[position:])
+
+    return patched
@@ -13,13 +13,19 @@ Attributes:
     defaults: When an entry is given a suffix with no
         value, a default value is assigned. These are
         those default values.
+    codecs: Codec per suffix, used in serialising values of
+        entries with said suffix. Suffixes without a codec
+        are serialised via JSON. See :func:`register_codec`
 
 """
 
 import os
+import io
 import abc
 import time
 import json
+import struct
+import weakref
 import logging
 
 from openmetadata import path
@@ -29,6 +35,13 @@ HISTORY = '.history'
 VERSIONS = '.versions'
 TRASH = '.trash'
 
+# Prefix of files being written, never listed
+TEMP = '.~'
+
+# Called with the absolute path of each file opened for writing
+# by Entry.open(), such that whatever is known of it may be forgotten
+write_hooks = list()
+
 log = logging.getLogger('openmetadata.lib')
 
 osname = os.name
@@ -44,6 +57,11 @@ def _currenttime():
     return time.strftime("%Y%m%d-%H%M%S", time.gmtime())
 
 
+# Values which may safely share their serialised form
+# with whomever has access to them.
+_immutable_types = (bool, int, long, float, str, unicode, type(None),
+                    buffer)
+
 _type_to_suffix = {
     bool:       ['bool'],
     int:        ['int'],
@@ -53,7 +71,10 @@ _type_to_suffix = {
     None:       ['null'],
     tuple:      ['tuple'],
     list:       ['list'],
-    dict:       ['dict']
+    dict:       ['dict'],
+    bytearray:  ['blob'],
+    buffer:     ['blob'],
+    memoryview: ['blob'],
 }
 
 
@@ -67,6 +88,175 @@ defaults = {
 }
 
 
+class Codec(object):
+    """Serialisation of values to and from what is stored on disk
+
+    Subclass and register via :func:`register_codec` to serialise
+    values of a particular suffix differently.
+
+    Attributes:
+        raw: Whether what is stored is the value itself, such that
+            it may be streamed. See :meth:`Entry.open`
+        mapped: Whether to map values into memory, rather than
+            reading them. `decode` is then passed a read-only
+            buffer, as opposed to a str.
+
+    """
+
+    raw = False
+    mapped = False
+
+    def encode(self, value):
+        """Return serialised `value` as str"""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """Return value from serialised `data`
+
+        Raises:
+            ValueError: If `data` is not a valid serialisation
+
+        """
+
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Default; compatible with every suffix and any language"""
+
+    def encode(self, value):
+        return json.dumps(value)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class TextCodec(Codec):
+    """Raw UTF-8 text, without JSON quoting and escaping
+
+    Example:
+        >>> TextCodec().encode(u'Hello "world"')
+        'Hello "world"'
+
+    """
+
+    raw = True
+
+    def encode(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+
+        if not isinstance(value, str):
+            raise TypeError("%r is not text" % value)
+
+        return value
+
+    def decode(self, data):
+        return data.decode('utf-8')
+
+
+class StructCodec(Codec):
+    """Fixed-size, little-endian binary numbers
+
+    Example:
+        >>> codec = StructCodec('<d')
+        >>> codec.decode(codec.encode(1.5))
+        1.5
+
+    """
+
+    def __init__(self, fmt):
+        self.struct = struct.Struct(fmt)
+
+    def encode(self, value):
+        try:
+            return self.struct.pack(value)
+        except struct.error as e:
+            raise ValueError(str(e))
+
+    def decode(self, data):
+        try:
+            return self.struct.unpack(data)[0]
+        except struct.error as e:
+            raise ValueError(str(e))
+
+
+class BlobCodec(Codec):
+    """Raw bytes, mapped into memory rather than read
+
+    Values are zero-copy views of the file in which they are
+    stored, such that slicing a header or range of a large
+    value only ever reads the pages being accessed.
+
+    Example:
+        >>> BlobCodec().encode(bytearray('abc'))
+        'abc'
+
+    """
+
+    raw = True
+    mapped = True
+
+    def encode(self, value):
+        if isinstance(value, memoryview):
+            return value.tobytes()
+
+        if isinstance(value, bytearray):
+            return str(value)
+
+        if isinstance(value, (str, buffer)):
+            # Buffers, including those mapped, are written as-is
+            return value
+
+        raise TypeError("%r is not bytes" % value)
+
+    def decode(self, data):
+        return data
+
+
+JSON = JsonCodec()
+TEXT = TextCodec()
+INT = StructCodec('<q')
+FLOAT = StructCodec('<d')
+BLOB = BlobCodec()
+
+codecs = {
+    'blob': BLOB,
+}
+
+
+def register_codec(suffix, codec):
+    """Serialise values of `suffix` via `codec`
+
+    Entries already written remain serialised via whichever
+    codec they were written with and must be re-written.
+
+    Example:
+        >>> register_codec('text', TEXT)
+        >>> get_codec('text') is TEXT
+        True
+        >>> register_codec('text', None)
+        >>> get_codec('text') is JSON
+        True
+
+    Arguments:
+        suffix (str): Suffix, such as "text"
+        codec (Codec): Codec with which to serialise, None
+            restores the default.
+
+    """
+
+    if codec is None:
+        codecs.pop(suffix, None)
+    else:
+        codecs[suffix] = codec
+
+
+def get_codec(suffix):
+    """Return codec of `suffix`"""
+    return codecs.get(suffix, JSON)
+
+
 def type_to_suffix(typ, hint=None):
     """Return suffix for `typ`, favouring `hint` if possible"""
     suffixes = _type_to_suffix.get(typ)
@@ -87,11 +277,33 @@ class Resource(object):
             are used to hierarchically organise resources.
 
     Attributes:
-        path: Current path, dynamic and based on current value/children
+        path: Current path, dynamic and based on current value/children.
+            The absolute path is cached and recomputed whenever `self`
+            or any of its ancestors is re-parented or changes suffix.
+        isdirty: Whether `self`, or any of its descendants, differs
+            from what is on disk. Resources are dirty until pulled or
+            flushed and made dirty again by assigning a value, adding
+            or clearing children.
+
+    Parents own their children, whereas children only refer weakly to
+    their parent, so that hierarchies are free of reference cycles and
+    freed as soon as they are no longer referenced. A child outliving
+    its parent, or removed from it, keeps its last known path.
 
     """
 
     __metaclass__ = abc.ABCMeta
+    __slots__ = ('_path',
+                 '_cached_path',
+                 '_value',
+                 '_encoded',
+                 '_loader',
+                 '_parent',
+                 '_children',
+                 'filter',
+                 'isdirty',
+                 '__weakref__')
+
     log = logging.getLogger('openmetadata.lib.Resource')
 
     def __iter__(self):
@@ -101,7 +313,7 @@ class Resource(object):
     def __getitem__(self, item):
         try:
             return self._children[item]
-        except KeyError:
+        except (KeyError, TypeError):
             raise KeyError("%r not in %r" % (item, self))
 
     def __contains__(self, key):
@@ -139,11 +351,14 @@ class Resource(object):
                 path = path.copy(suffix=type)
 
         self._path = path
+        self._cached_path = None
         self._value = value
+        self._encoded = None
+        self._loader = None
         self._parent = None
-        self._children = dict()
+        self._children = None  # Allocated upon first child
         self.filter = None
-        self.isdirty = False
+        self.isdirty = True
 
         if parent:
             parent.add(self)
@@ -162,22 +377,107 @@ class Resource(object):
             # Clear out value if a child is added, as there
             # can't be both value and child.
             self._value = dict()
+            self._encoded = None
 
         if not self.type in ('dict', 'list'):
             self._path = self._path.copy(suffix='dict')
+            self._invalidate()
+
+        self._adopt(child)
+
+        # The child, along with its descendants, is
+        # new to `self` and thus new to disk.
+        child._dirty_all()
+        self._dirty()
+
+    def _dirty(self):
+        """Mark `self` and its ancestors as dirty
+
+        Ancestors of a dirty resource are always dirty, which means
+        marking may stop at the first ancestor already marked.
+
+        """
+
+        resource = self
+        while resource is not None and not resource.isdirty:
+            resource.isdirty = True
+            resource = resource.parent
+
+    def _dirty_all(self):
+        """Mark `self` and its descendants as dirty"""
+        self.isdirty = True
+
+        if self._children:
+            for child in self._children.itervalues():
+                child._dirty_all()
+
+    def _adopt(self, child):
+        """Store `child`, detaching any child it replaces"""
+        if self._children is None:
+            self._children = dict()
+
+        replaced = self._children.get(child._path.name)
+        if replaced is not None and replaced is not child:
+            replaced._detach()
 
-        self._children[child.path.name] = child
-        child._parent = self
+        self._children[child._path.name] = child
+        child._attach(self)
+
+    def _attach(self, parent):
+        """Refer to `parent` without being added as one of its children"""
+        self._parent = weakref.ref(parent)
+        self._invalidate()
+
+    def _detach(self):
+        """Forget parent, keeping the path last derived from it"""
+        self._parent = None
+
+    def _sibling(self, path):
+        """Return new resource `path`, alongside `self`
+
+        The sibling refers to the parent of `self`, without
+        being added as one of its children, and is placed
+        alongside `self` even if said parent is gone.
+
+        """
+
+        sibling = type(self)(path)
+        sibling._parent = self._parent
+        sibling._cached_path = self.path
+        sibling._invalidate()
+        return sibling
+
+    def _invalidate(self):
+        """Recompute cached path of `self` and its descendants
+
+        The path is computed up-front, whilst the parent is still
+        around to ask. Should the parent have been collected, or
+        `self` detached from it, the path is re-derived from the one
+        last known.
+
+        """
+
+        parent = self.parent
+        if parent is not None:
+            self._cached_path = parent.path + self._path
+
+        elif self._cached_path is not None:
+            parent_path = self._cached_path.parent
+            if parent_path is not None:
+                self._cached_path = parent_path + self._path
+            else:
+                self._cached_path = self._path
+
+        if self._children:
+            for child in self._children.itervalues():
+                child._invalidate()
 
     @property
     def path(self):
-        path = self._path
+        if self._cached_path is None:
+            self._cached_path = self._path
 
-        if not self._parent:
-            return path
-
-        parent_path = self._parent.path
-        return parent_path + path
+        return self._cached_path
 
     @property
     def name(self):
@@ -230,17 +530,25 @@ class Resource(object):
                     value.copy(deep=True, parent=copy)
         else:
             copy._value = self._value
+            copy._loader = self._loader
 
         # Make the copy aware of `self` parent, but `self`
         # should not be aware of `copy` as a child, as it would
         # cause `self` to get a duplicate child per copy.
         copy._parent = self._parent
+        copy._cached_path = self.path
+        copy._invalidate()
 
         return copy
 
     def clear(self):
         """Remove existing value/children"""
-        self._children.clear()
+        if self._children:
+            for child in self._children.itervalues():
+                child._detach()
+
+            self._children = None
+            self._dirty()
 
     def ls(self, _level=0):
         """List contained children"""
@@ -254,10 +562,15 @@ class Resource(object):
 
     @property
     def parent(self):
-        return self._parent
+        if self._parent is None:
+            return None
+        return self._parent()
 
     @property
     def children(self):
+        if not self._children:
+            return
+
         for _, child in self._children.iteritems():
             if self.filter:
                 if self.filter(child):
@@ -265,13 +578,40 @@ class Resource(object):
             else:
                 yield child
 
+    def defer(self, loader):
+        """Defer loading of value until first accessed
+
+        `loader` is called with `self` upon accessing `value` and is
+        expected to load a value into `self`, via e.g. load(). The
+        loader is discarded once called, unless it returns True, in
+        which case it is called again upon each access; such as to
+        reload a value having changed since it was last loaded.
+
+        Assigning a value discards any deferred loader.
+
+        Arguments:
+            loader (callable): Callable taking a single argument `self`
+
+        """
+
+        self._value = None
+        self._encoded = None
+        self._loader = loader
+
     @property
     def value(self):
+        loader = self._loader
+        if loader is not None:
+            self._loader = None
+            if loader(self):
+                self._loader = loader
+
         if self._value is None:
             default = defaults.get(self.type)
             if hasattr(default, '__call__'):
                 default = default()
             self._value = default
+            self._encoded = None
         return self._value
 
     @value.setter
@@ -284,7 +624,7 @@ class Resource(object):
 
     @property
     def has_value(self):
-        return self._value is not None
+        return self._value is not None or self._loader is not None
 
     @property
     def has_parent(self):
@@ -307,6 +647,8 @@ class Location(Resource):
 
     """
 
+    __slots__ = ()
+
     log = logging.getLogger('openmetadata.lib.Location')
 
     def __init__(self, *args, **kwargs):
@@ -315,6 +657,7 @@ class Location(Resource):
         # Give location a platform-dependent
         # path; e.g. either WindowsPath or PosixPath.
         self._path = DefaultPath(self._path.as_str)
+        self._invalidate()
 
         if not self._path.isabsolute:
             raise error.RelativePath(
@@ -329,12 +672,24 @@ class Location(Resource):
         """
 
         self._value = None
-        self._children[child.path.name] = child
-        child._parent = self
+
+        self._adopt(child)
+
+        child._dirty_all()
+        self._dirty()
+
+    def _invalidate(self):
+        self._cached_path = self._path + self._path.CONTAINER
+
+        if self._children:
+            for child in self._children.itervalues():
+                child._invalidate()
 
     @property
     def path(self):
-        return self._path + self._path.CONTAINER
+        if self._cached_path is None:
+            self._cached_path = self._path + self._path.CONTAINER
+        return self._cached_path
 
     @property
     def old_path(self):
@@ -388,6 +743,8 @@ class Entry(Resource):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         """
         Example
@@ -407,6 +764,7 @@ class Entry(Resource):
         super(Entry, self).__init__(*args, **kwargs)
 
         self._path = MetaPath(self._path.as_str)
+        self._invalidate()
 
         if not self._path.isrelative:
             raise error.RelativePath(
@@ -420,39 +778,299 @@ class Entry(Resource):
 
     @property
     def value(self):
-        return super(Entry, self).value
+        value = super(Entry, self).value
+
+        # The caller may modify a mutable value in-place,
+        # making its serialised form unreliable.
+        if not isinstance(value, _immutable_types):
+            self._encoded = None
+
+        return value
 
     @value.setter
     def value(self, value):
+        self._assign(value)
+
+    def _assign(self, value, encoded=None, codec=None, dirty=True):
+        """Assign `value`, along with its serialised form
+
+        Serialising a value both validates it and produces what is
+        later written to disk; the serialised form is kept and reused
+        by dump() until the value is replaced or handed out via `value`.
+        As such, a mutable value modified in-place after having been
+        assigned must be assigned again.
+
+        Arguments:
+            value (object): Value to assign
+            encoded (str, optional): Serialised form of `value`, if known
+            codec (Codec, optional): Codec having produced `encoded`
+            dirty (bool, optional): Mark `self` as dirty, False
+                when `value` is what is already on disk.
+
+        """
+
         if value is not None:
             datatype = type(value)
 
             suffix = type_to_suffix(datatype, hint=self.type)
-            self._path = self._path.copy(suffix=suffix)
+            if suffix != self._path.suffix:
+                self._path = self._path.copy(suffix=suffix)
+                self._invalidate()
 
         assert self.type, self.path.as_str
 
         # Values always replace children
-        self.clear()
+        if self._children:
+            for child in self._children.itervalues():
+                child._detach()
+        self._children = None
+
+        if value is None:
+            encoded = None
+        else:
+            current_codec = get_codec(self.type)
+            if encoded is None or codec is not current_codec:
+                encoded = current_codec.encode(value)
 
-        assert json.dumps(value)
         self._value = value
+        self._encoded = encoded
+        self._loader = None
+
+        if dirty:
+            self._dirty()
 
     def load(self, value):
-        """De-serialise `value` into `self`"""
+        """De-serialise `value` into `self`
+
+        As `value` is assumed to come from disk, loading
+        does not make `self` dirty.
+
+        """
+
+        codec = get_codec(self.type)
         try:
-            self.value = json.loads(value)
+            decoded = codec.decode(value)
         except ValueError:
             log.warning("%s contains invalid value: %r" % (self.path, value))
-            self.value = None
+            self._assign(None, dirty=False)
+        else:
+            self._assign(decoded, encoded=value, codec=codec, dirty=False)
 
     def dump(self):
         """Serialise contents of `self`"""
-        assert not isinstance(self.value, dict)
-        value = self.value
+        value = super(Entry, self).value
+        assert not isinstance(value, dict)
         if value is None:
             return None
-        return json.dumps(value)
+
+        encoded = self._encoded
+        if encoded is None:
+            encoded = get_codec(self.type).encode(value)
+
+            if isinstance(value, _immutable_types):
+                self._encoded = encoded
+
+        return encoded
+
+    def open(self, mode='r'):
+        """Stream value of `self` from, or to, disk
+
+        As opposed to accessing `value`, the value is never held
+        in memory as a whole. Only suffixes whose codec stores
+        values as-is may be streamed, such as blobs, or text once
+        :class:`TextCodec` is registered for it. By default, text is
+        serialised as JSON and may not be streamed; see
+        :func:`register_codec`.
+
+        Opening for writing discards the current value of `self`;
+        pull to read what was written.
+
+        Example:
+            >> register_codec('text', TEXT)
+            >> entry = Entry('story.text', parent=location)
+            >> with entry.open('w') as f:
+            ..     f.write(u'Once upon a time')
+
+        Arguments:
+            mode (str): Mode with which to open, as per io.open()
+
+        Returns:
+            File-like object; text for text, binary for blobs.
+
+        Raises:
+            error.Serialisation: If suffix of `self` may not be streamed
+
+        """
+
+        codec = get_codec(self.type)
+        if not codec.raw:
+            raise error.Serialisation(
+                "%s is serialised via %s and may not be streamed, "
+                "see register_codec()" % (self.path, type(codec).__name__))
+
+        path = self.path.as_str
+
+        if 'r' not in mode:
+            self._assign(None, dirty=False)
+
+            dirname = os.path.dirname(path)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            for hook in write_hooks:
+                hook(path)
+
+        if isinstance(codec, TextCodec):
+            return io.open(path, mode.replace('b', ''), encoding='utf-8')
+
+        return io.open(path, mode if 'b' in mode else mode + 'b')
+
+
+class Layers(object):
+    """Read-only view of a resource inherited from `layers`
+
+    Layers are ordered closest-first, such as per-location copies of
+    an entry from a location and upwards through its parents. Looking
+    up a child falls through layers in order, until the first layer
+    holding it. Children present as collections in several layers are
+    themselves returned as a view, whereas a value further up is
+    overridden by children closer by, and overrides any children
+    further up still.
+
+    Nothing is copied; neither layers nor their children are
+    modified or re-parented, and children are resolved on demand.
+    Resources not yet pulled, such as children of a pulled layer,
+    are read via `pull` upon first being looked up.
+
+    Example:
+        >>> root = Entry('apps.dict')
+        >>> _ = Entry('maya', value=2015, parent=root)
+        >>> child = Entry('apps.dict')
+        >>> _ = Entry('nuke', value=9, parent=child)
+        >>> layers = Layers([child, root])
+        >>> sorted(layers.value.items())
+        [('maya', 2015), ('nuke', 9)]
+        >>> layers['maya'].value
+        2015
+
+    Arguments:
+        layers (list): Resources from which to inherit, closest first
+        pull (callable, optional): Called with each resource holding
+            neither children nor value, before being looked up
+
+    """
+
+    __slots__ = ('_layers', '_pull')
+
+    def __init__(self, layers, pull=None):
+        self._layers = tuple(layers)
+        self._pull = pull
+
+    def __iter__(self):
+        for child in self.children:
+            yield child
+
+    def __getitem__(self, item):
+        matches = list()
+
+        for layer in self._layers:
+            if not Layers._iscollection(layer):
+                break
+
+            self._expand(layer)
+
+            try:
+                child = layer[item]
+            except KeyError:
+                continue
+
+            if not Layers._iscollection(child):
+                if not matches:
+                    self._expand(child)
+                    return child
+                break
+
+            matches.append(child)
+
+        if not matches:
+            raise KeyError("%r not in %r" % (item, self))
+
+        return Layers(matches, pull=self._pull)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return u"%s.%s(%r)" % (__name__, type(self).__name__, self._layers)
+
+    def _expand(self, resource):
+        if (self._pull is not None and
+                resource._children is None and
+                not resource.has_value):
+            self._pull(resource)
+
+    @staticmethod
+    def _iscollection(resource):
+        return (isinstance(resource, Location) or
+                resource.type in ('dict', 'list'))
+
+    @property
+    def layers(self):
+        return self._layers
+
+    @property
+    def path(self):
+        return self._layers[0].path
+
+    @property
+    def name(self):
+        return self._layers[0].name
+
+    @property
+    def type(self):
+        return self._layers[0].type
+
+    @property
+    def children(self):
+        visited = set()
+
+        for layer in self._layers:
+            if not Layers._iscollection(layer):
+                break
+
+            self._expand(layer)
+
+            for child in layer:
+                if child.name in visited:
+                    continue
+                visited.add(child.name)
+                yield self[child.name]
+
+    @property
+    def value(self):
+        """Value of closest layer, or values of children"""
+        if not self._layers:
+            return None
+
+        if not Layers._iscollection(self._layers[0]):
+            return self._layers[0].value
+
+        return dict((child.name, child.value) for child in self.children)
+
+    @property
+    def has_children(self):
+        return any(True for _ in self.children)
+
+    @property
+    def has_value(self):
+        return any(layer.has_value for layer in self._layers)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,20 @@
 import re
 import logging
+import threading
+import collections
+
+# Maximum number of parsed paths to remember, see Path.parse()
+PARSE_CACHE_SIZE = 4096
+
+# Placeholder for attributes not yet computed, where None is a valid value
+_unset = object()
+
+
+def _intern(string):
+    """Share identical components, such as suffixes, between paths"""
+    if type(string) is str:
+        return intern(string)
+    return string
 
 
 class Path(object):
@@ -31,6 +46,11 @@ class Path(object):
     |  output  |<-----| deparse |
     |__________|      |_________|
 
+    Paths are compact; components such as name and suffix are
+    computed once, on first access, and shared between paths
+    via interning. Parents are computed once per path, making
+    each path share its chain of parents with its siblings.
+
 
     Attributes:
         log: Current logger for object
@@ -50,9 +70,12 @@ class Path(object):
         EscapePattern: Regex for double back-slashes
         MultipleSlashPattern: Regex for multiple forward-slashes
         SupportedCharactersPattern: Regex for all supported characters
+        UnsupportedCharactersPattern: Regex for any unsupported character
 
     """
 
+    __slots__ = ('_path', '_as_str', '_name', '_suffix', '_parent')
+
     log = logging.getLogger('openmetadata.path.Path')
 
     EXT = '.'
@@ -69,6 +92,10 @@ class Path(object):
     EscapePattern = re.compile(r'\\')
     MultipleSlashPattern = re.compile(r'(/)\1+')
     SupportedCharactersPattern = re.compile(r'[&$/:\w\. =-]*')
+    UnsupportedCharactersPattern = re.compile(r'[^&$/:\w\. =-]')
+
+    _parse_cache = collections.OrderedDict()
+    _parse_lock = threading.Lock()
 
     def __str__(self):
         return self.as_str or ''
@@ -89,6 +116,19 @@ class Path(object):
         return str(other) != self.as_str
 
     def __add__(self, other):
+        # Joining already parsed paths, or a single component
+        # such as those returned by os.listdir, with a non-root
+        # path results in an already parsed path.
+        if self._path:
+            if isinstance(other, Path):
+                if other._path and not other.root:
+                    return self._trusted(self.PROCSEP.join(
+                        [self._path, other._path]))
+
+            elif self._iscomponent(other):
+                return self._trusted(self.PROCSEP.join(
+                    [self._path, other]))
+
         sep = self.SEP
         new_path = sep.join([self.as_str, str(other)])
         return self.copy(path=new_path)
@@ -107,8 +147,6 @@ class Path(object):
         assert isinstance(path, basestring), path
 
         self._path = None
-        self.__suffix = None
-
         self.set(path)
 
     def set(self, path):
@@ -133,17 +171,17 @@ class Path(object):
 
         path = self.parse(path)
 
-        supported = self.SupportedCharactersPattern.findall(path)
-        unsupported = path.strip("".join(supported))
-        if unsupported:
-            raise ValueError(
-                "Unsupported character found in path: %s" % unsupported)
+        self._validate(path)
 
-        # Clear memoized cache
-        if hasattr(self, '_as_str'):
-            delattr(self, '_as_str')
+        self._reset(path)
 
+    def _reset(self, path):
+        """Replace parsed `path` and clear memoized components"""
         self._path = path
+        self._as_str = None
+        self._name = None
+        self._suffix = None
+        self._parent = _unset
 
     def copy(self, path=None, basename=None, suffix=None):
         """
@@ -172,6 +210,19 @@ class Path(object):
 
         """
 
+        if not (path or basename):
+            # Copying self, optionally with a simple
+            # suffix, bypasses parsing altogether.
+            if not suffix:
+                return self._trusted(self._path)
+
+            if self._iscomponent(suffix) and self.EXT not in suffix:
+                current_suffix = self.suffix
+                path = self._path
+                if current_suffix:
+                    path = path[:-(len(current_suffix) + 1)]
+                return self._trusted(path + self.EXT + suffix)
+
         path = path or self._path
 
         if basename:
@@ -192,9 +243,93 @@ class Path(object):
 
         return type(self)(path)
 
+    @classmethod
+    def _trusted(cls, path):
+        """Construct from an already parsed and validated `path`
+
+        This is the fast-path of Path construction, bypassing
+        both parsing and validation; `path` MUST come from
+        another Path, or have been parsed by cls.parse().
+
+        """
+
+        self = cls.__new__(cls)
+        self._reset(path)
+        return self
+
+    @classmethod
+    def _iscomponent(cls, value):
+        """Return whether `value` is a single, valid path component
+
+        Components, such as names returned by os.listdir, are left
+        untouched by parsing and may thus be joined as-is.
+
+        Example:
+            >>> Path._iscomponent('entry.string')
+            True
+            >>> Path._iscomponent('..')
+            False
+            >>> Path._iscomponent('parent/child')
+            False
+
+        """
+
+        if not isinstance(value, basestring) or not value:
+            return False
+
+        if value in (cls.PARENT_DIR, cls.CURRENT_DIR):
+            return False
+
+        if '/' in value or '\\' in value or ':' in value:
+            return False
+
+        return not cls.UnsupportedCharactersPattern.search(value)
+
+    @classmethod
+    def _validate(cls, path):
+        match = cls.UnsupportedCharactersPattern.search(path)
+        if match:
+            raise ValueError(
+                "Unsupported character found in path: %s" % match.group(0))
+
     @classmethod
     def parse(cls, path):
-        """Conform incoming `path` to using only single forward slashes"""
+        """Conform incoming `path` to using only single forward slashes
+
+        Results are cached per class, such that re-parsing a recently
+        parsed path costs a single lookup. The cache may be shared
+        between threads. See :func:`_parse`
+
+        Example:
+            >>> Path.parse(r'c:\\users//marcus/./home/..')
+            'c:/users/marcus'
+
+        """
+
+        cache = Path._parse_cache
+        key = (cls, path)
+
+        with Path._parse_lock:
+            parsed = cache.pop(key, None)
+
+        if parsed is None:
+            parsed = cls._parse(path)
+
+        with Path._parse_lock:
+            if len(cache) >= PARSE_CACHE_SIZE:
+                try:
+                    cache.popitem(last=False)
+                except KeyError:
+                    pass
+
+            # Most recently used are kept last
+            cache[key] = parsed
+
+        return parsed
+
+    @classmethod
+    def _parse(cls, path):
+        """Parse `path` without consulting the cache"""
         path_ = re.sub(Path.EscapePattern, '/', path)
         path_ = re.sub(Path.MultipleSlashPattern, r'\1', path_)
         path_ = path_.replace(cls.SEP, '/')
@@ -254,18 +389,34 @@ class Path(object):
 
         """
 
-        name = self._path.split(self.PROCSEP)[-1] or self._path
+        if self._name is None:
+            self._split()
+        return self._name
+
+    def _split(self):
+        """Compute name and suffix, once
 
-        # if name == self.CONTAINER:
-        #     return self.parent.name
+        The basename is located once, from which both name
+        and suffix are derived and interned.
 
-        if name.startswith(self.EXT):
-            return name
+        """
 
-        if self.EXT in name:
+        path = self._path
+        basename = path[path.rfind(self.PROCSEP) + 1:]
+
+        name = basename or path
+        if not name.startswith(self.EXT):
             name = name.split(self.EXT, 1)[0]
 
-        return name
+        suffix = None
+        if basename != self.CONTAINER:
+            index = basename.find(self.EXT)
+            if index != -1:
+                # Disregard the "."
+                suffix = _intern(basename[index + 1:])
+
+        self._suffix = suffix
+        self._name = _intern(name)
 
     @property
     def basename(self):
@@ -334,7 +485,7 @@ class Path(object):
         """
 
         path = self._path.split(self.CONTAINER, 1)[0]
-        return type(self)(path)
+        return self._trusted(path.rstrip('/'))
 
     @property
     def parent(self):
@@ -355,17 +506,20 @@ class Path(object):
             >>> path.parent
         """
 
-        path = self._path
+        if self._parent is _unset:
+            path = self._path
 
-        parent = path.rsplit('/', 1)[0]
+            parent = path.rsplit('/', 1)[0]
 
-        if not parent or parent == path:
-            # parent is '' when path == SEP
-            # parent == _path when _path is root
-            # parent = '/'
-            return None
+            if not parent or parent == path:
+                # parent is '' when path == SEP
+                # parent == _path when _path is root
+                # parent = '/'
+                self._parent = None
+            else:
+                self._parent = self._trusted(parent)
 
-        return type(self)(parent)
+        return self._parent
 
     @property
     def parents(self):
@@ -380,9 +534,10 @@ class Path(object):
         parent = self.parent
         parents = []
         while parent:
-            parents.insert(0, parent)
+            parents.append(parent)
             parent = parent.parent
 
+        parents.reverse()
         return parents
 
     @property
@@ -438,19 +593,9 @@ class Path(object):
 
         """
 
-        suffix = None
-
-        basename = self._path.rsplit(self.PROCSEP, 1)[-1]
-
-        if basename == self.CONTAINER:
-            return None
-
-        match = self.SuffixPattern.search(basename)
-        if match:
-            # Disregard the "."
-            suffix = match.group(0)[1:]
-
-        return suffix
+        if self._name is None:
+            self._split()
+        return self._suffix
 
     def startswith(self, predicate):
         return self.as_str.startswith(predicate)
@@ -477,7 +622,7 @@ class Path(object):
             '/root/child'
         """
 
-        if not hasattr(self, '_as_str'):
+        if self._as_str is None:
             self._as_str = self.deparse()
 
         return self._as_str
@@ -500,6 +645,8 @@ class DirPath(Path):
     refer to the two subclasses, WindowsPath and PosixPath, via a
     isinstance and issubclass"""
 
+    __slots__ = ()
+
     FAMILY = 'dir'
 
 
@@ -518,13 +665,15 @@ class WindowsPath(DirPath):
 
     """
 
+    __slots__ = ()
+
     SEP = '\\'
 
     DrivePattern = re.compile(r'^\w:')
 
     @classmethod
-    def parse(cls, path):
-        _path = super(WindowsPath, cls).parse(path)
+    def _parse(cls, path):
+        _path = super(WindowsPath, cls)._parse(path)
 
         match = cls.DrivePattern.search(_path)
         if match:
@@ -562,11 +711,11 @@ class WindowsPath(DirPath):
 
 
 class PosixPath(DirPath):
-    pass
+    __slots__ = ()
 
 
 class MetaPath(DirPath):
-    pass
+    __slots__ = ()
 
 
 if __name__ == '__main__':
@@ -19,6 +19,23 @@ class TestEntry(tests.DynamicTestCase):
         entry.value = "Hello"
         self.assertEquals(entry.type, 'string')
 
+    def test_dump_reuses_encoded(self):
+        """Values are serialised once, upon assignment"""
+        entry = om.Entry('loaded', parent=self.root)
+        entry.load('[1,  2]')
+        self.assertEquals(entry.dump(), '[1,  2]')
+
+        entry.value = [1, 2]
+        self.assertEquals(entry.dump(), '[1, 2]')
+
+    def test_dump_modified_inplace(self):
+        """Values handed out and modified in-place are re-serialised"""
+        entry = om.Entry('mutable', value=[1, 2], parent=self.root)
+        entry.value.append(3)
+        self.assertEquals(entry.dump(), '[1, 2, 3]')
+        entry.value.append(4)
+        self.assertEquals(entry.dump(), '[1, 2, 3, 4]')
+
 
 class TestDuplicates(tests.FixtureTestCase):
     def test_duplicate_entries(self):
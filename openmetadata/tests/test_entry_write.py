@@ -222,6 +222,254 @@ class TestEntryWrite(tests.DynamicTestCase):
         om.pull(height)
         self.assertEquals(height.type, 'float')
 
+    def test_flush_lists_once(self):
+        """Flushing a group lists each directory once"""
+        group = om.Entry('group', parent=self.root)
+        for index in range(20):
+            om.Entry('key%i' % index, value=index, parent=group)
+
+        om.flush(group)
+
+        listed = list()
+        original = om.util._list
+
+        def list_(path):
+            listed.append(path)
+            return original(path)
+
+        om.util._list = list_
+        try:
+            for child in group:
+                child.value = -1
+            om.flush(group)
+        finally:
+            om.util._list = original
+
+        self.assertEquals(sorted(listed), sorted(set(listed)))
+        self.assertEquals(om.read(self.root_path, 'group/key5'), -1)
+
+    def test_flush_plan(self):
+        """Existing entries of another suffix are recycled"""
+        om.flush(om.Entry('height', value=10, parent=self.root))
+
+        height = om.Entry('height', value=11.1, parent=self.root)
+        plan = om.api._plan_flush(height, track_history=False)
+
+        self.assertEquals([operation for operation, _ in plan],
+                          ['recycle', 'write', 'clean', 'touch'])
+        self.assertEquals(plan[0][1].type, 'int')
+        self.assertIs(self.root['height'], height)
+
+        # Containers are touched for the sake of cached trees
+        self.assertEquals(plan[-1], ('touch', self.root.path.as_str))
+
+    def test_pull_hidden(self):
+        """Trash may be left out whilst pulling"""
+        om.flush(om.Entry('height', value=10, parent=self.root))
+        om.flush(om.Entry('height', value=1.5, parent=self.root))
+
+        names = [child.name for child in om.pull(self.root)]
+        self.assertEquals(sorted(names), ['.trash', 'height'])
+
+        location = om.pull(om.Location(self.root_path), hidden=False)
+        self.assertEquals([child.name for child in location], ['height'])
+
+    def test_pull_workers(self):
+        """Pulling in parallel yields the same tree as pulling serially"""
+        for group in range(5):
+            group = om.Entry('group%i' % group, parent=self.root)
+            for index in range(10):
+                subgroup = om.Entry('sub%i' % index, parent=group)
+                om.Entry('value', value=index, parent=subgroup)
+                om.Entry('text', value='%i' % index, parent=subgroup)
+        om.flush(self.root)
+
+        def tree(resource):
+            return dict((child.path.basename,
+                         tree(child) if child.type in ('dict', 'list')
+                         else child.value)
+                        for child in resource)
+
+        serial = om.pull(om.Location(self.root_path), depth=4)
+        parallel = om.pull(om.Location(self.root_path), depth=4, workers=4)
+
+        self.assertEquals(tree(parallel), tree(serial))
+        self.assertEquals(tree(parallel['group3']['sub7']),
+                          {'value.int': 7, 'text.string': '7'})
+        self.assertFalse(parallel.isdirty)
+        self.assertFalse(parallel['group3']['sub7']['value'].isdirty)
+
+    def test_preload(self):
+        """Preloaded values are pulled and read without touching disk"""
+        group = om.Entry('group', parent=self.root)
+        for index in range(10):
+            om.Entry('key%i' % index, value=index, parent=group)
+        om.Entry('height', value=10, parent=self.root)
+        om.flush(self.root)
+
+        self.addCleanup(om.unload)
+
+        location = om.preload(self.root_path, workers=4)
+        self.assertEquals(location['group']['key3'].value, 3)
+
+        def io(*args, **kwargs):
+            raise AssertionError("Touched disk: %r" % (args,))
+
+        original = om.util._list, os.stat, os.path.exists
+        om.util._list = os.stat = os.path.exists = om.api.open = io
+        try:
+            self.assertEquals(om.read(self.root_path, 'group/key5'), 5)
+            location = om.pull(om.Location(self.root_path), depth=3)
+            self.assertEquals(location['height'].value, 10)
+        finally:
+            om.util._list, os.stat, os.path.exists = original
+            del om.api.open
+
+        om.write(self.root_path, 'group/key5', 6)
+        self.assertEquals(om.read(self.root_path, 'group/key5'), 6)
+
+        om.unload()
+        self.assertEquals(om.api._preloaded, {})
+
+    def test_preload_bounded(self):
+        """Values beyond the memory bound are read as usual"""
+        for index in range(10):
+            om.Entry('key%i' % index, value='x' * 100, parent=self.root)
+        om.flush(self.root)
+
+        self.addCleanup(om.unload)
+
+        location = om.preload(self.root_path, max_bytes=500)
+        self.assertTrue(0 < len(om.api._preloaded) < 5)
+        self.assertEquals(location['key9'].value, 'x' * 100)
+
+        # The bound holds across calls..
+        om.preload(self.root_path, max_bytes=500)
+        self.assertTrue(om.api._preloaded_bytes <= 500)
+
+        # ..whereas smaller values may still fit
+        om.write(self.root_path, 'small', 1)
+        om.preload(self.root_path, max_bytes=500)
+        self.assertIn(om.entry(self.root_path, 'small').path.as_str,
+                      om.api._preloaded)
+
+        om.unload()
+        self.assertEquals(om.api._preloaded_bytes, 0)
+
+    def test_preload_open(self):
+        """Streaming to a preloaded value forgets it"""
+        om.register_codec('text', om.lib.TEXT)
+        self.addCleanup(om.register_codec, 'text', None)
+        self.addCleanup(om.unload)
+
+        om.write(self.root_path, 'story.text', u'Once')
+        om.preload(self.root_path)
+
+        story = om.entry(self.root_path, 'story.text')
+        with story.open('w') as f:
+            f.write(u'Twice')
+
+        self.assertEquals(om.read(self.root_path, 'story'), u'Twice')
+
+    def test_pull_deferred(self):
+        """Deferred values are read upon first access"""
+        group = om.Entry('group', parent=self.root)
+        om.Entry('height', value=10, parent=group)
+        om.flush(group)
+
+        group = om.Entry('group', parent=self.root)
+        om.pull(group, depth=2, defer=True)
+        height = group['height']
+        self.assertTrue(height.has_value)
+
+        with open(height.path.as_str, 'w') as f:
+            f.write('15')
+
+        self.assertEquals(height.value, 15)
+
+        # Once read, deferred values are left alone..
+        with open(height.path.as_str, 'w') as f:
+            f.write('20')
+
+        self.assertEquals(height.value, 15)
+
+    def test_pull_deferred_validate(self):
+        """Validated values are re-read when modified"""
+        height = om.Entry('height', value=10, parent=self.root)
+        om.flush(height)
+
+        om.pull(height, defer=True, validate=True)
+        self.assertEquals(height.value, 10)
+
+        with open(height.path.as_str, 'w') as f:
+            f.write('15')
+
+        mtime = os.stat(height.path.as_str).st_mtime
+        os.utime(height.path.as_str, (mtime + 10, mtime + 10))
+        self.assertEquals(height.value, 15)
+
+        # Assigning a value replaces what was deferred
+        height.value = 5
+        self.assertEquals(height.value, 5)
+
+    def test_flush_dirty(self):
+        """Only modified entries are flushed"""
+        for key, value in self.data.iteritems():
+            om.Entry(key, value=value, parent=self.root)
+        om.flush(self.root)
+
+        location = om.Location(self.root_path)
+        om.pull(location)
+        self.assertFalse(location.isdirty)
+        self.assertEquals(om.api._plan_flush(location), [])
+
+        location['hello'].value = 'there'
+        self.assertTrue(location.isdirty)
+
+        plan = om.api._plan_flush(location)
+        written = [subject for operation, subject in plan
+                   if operation == 'write']
+        self.assertEquals(written, [location['hello']])
+
+        om.flush(location)
+        self.assertFalse(location.isdirty)
+        self.assertEquals(om.read(self.root_path, 'hello'), 'there')
+
+    def test_flush_moved(self):
+        """Clean children are flushed along with their new parent"""
+        group = om.Entry('group', parent=self.root)
+        om.Entry('child', value=1, parent=group)
+        om.flush(group)
+
+        group = om.Entry('group', parent=om.Location(self.root_path))
+        om.pull(group, depth=2)
+
+        other = om.Entry('other', parent=self.root)
+        other.add(group)
+        om.flush(other)
+
+        self.assertEquals(om.read(self.root_path, 'other/group/child'), 1)
+
+    def test_flush_unchanged(self):
+        """Values already on disk are neither written nor tracked"""
+        height = om.Entry('height', value=10, parent=self.root)
+        self.assertEquals(om.flush(height, track_history=True), [])
+
+        mtime = int(os.stat(height.path.as_str).st_mtime) - 10
+        os.utime(height.path.as_str, (mtime, mtime))
+
+        height = om.Entry('height', value=10, parent=self.root)
+        self.assertEquals(om.flush(height, track_history=True), [height])
+        self.assertEquals(os.stat(height.path.as_str).st_mtime, mtime)
+
+        history = os.path.join(self.root.path.as_str, '.history')
+        self.assertFalse(os.path.exists(history))
+
+        # Values of equal size are compared by content
+        height = om.Entry('height', value=11, parent=self.root)
+        self.assertEquals(om.flush(height), [])
+        self.assertEquals(om.read(self.root_path, 'height'), 11)
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,476 @@
+import os
+
+# Subject
+import openmetadata as om
+from openmetadata import tests
+from openmetadata import journal
+
+
+class TestHistory(tests.DynamicTestCase):
+    def setUp(self):
+        super(TestHistory, self).setUp()
+        self.container = self.root.path.as_str
+        om.flush(om.Entry('height', value=10, parent=self.root))
+
+    def test_directory(self):
+        """Imprints are stored as a directory each, under .history"""
+        om.flush(om.Entry('height', value=11, parent=self.root),
+                 track_history='directory')
+
+        history = os.path.join(self.container, om.lib.HISTORY)
+        imprint, = os.listdir(history)
+        self.assertTrue(imprint.startswith('height&'))
+        self.assertEquals(sorted(os.listdir(os.path.join(history, imprint))),
+                          ['user.string', 'value.int'])
+
+    def test_journal(self):
+        """Imprints are appended to a single journal"""
+        for value in (11, 12.5, 13):
+            om.flush(om.Entry('height', value=value, parent=self.root),
+                     track_history='journal')
+
+        history = os.path.join(self.container, om.lib.HISTORY)
+        self.assertEquals(sorted(os.listdir(history)),
+                          [journal.JOURNAL, journal.INDEX])
+
+        imprints = journal.Journal(self.container).imprints('height')
+        self.assertEquals([imprint.value for imprint in imprints],
+                          [10, 11, 12.5])
+        self.assertEquals([imprint.suffix for imprint in imprints],
+                          ['int', 'int', 'float'])
+
+    def test_journal_recover(self):
+        """Unindexed records are recovered and torn records discarded"""
+        history = journal.Journal(self.container)
+        history.append('height', 'int', '1', 'marcus', '20140101-000000')
+        history.append('height', 'int', '2', 'marcus', '20140101-000001')
+
+        # Crash after appending, but before indexing
+        with open(history.index_path, 'rb') as f:
+            lines = f.readlines()
+        with open(history.index_path, 'wb') as f:
+            f.write(lines[0])
+
+        self.assertEquals(len(history.imprints()), 2)
+
+        # Crash whilst appending
+        with open(history.path, 'ab') as f:
+            f.write('\x40\x00\x00\x00torn')
+
+        history.append('height', 'int', '3', 'marcus', '20140101-000002')
+
+        imprints = history.imprints()
+        self.assertEquals([imprint.value for imprint in imprints], [1, 2, 3])
+        self.assertEquals(len(history._indexed()), 3)
+        self.assertEquals(imprints[-1].end, os.path.getsize(history.path))
+
+    def test_journal_tail(self):
+        """Appending reads only the end of the index"""
+        history = journal.Journal(self.container)
+        history.append('height', 'int', '1', 'marcus', '20140101-000000')
+
+        # Crash whilst indexing
+        with open(history.index_path, 'ab') as f:
+            f.write('height\tint\t2014')
+
+        history._indexed = None
+        history.append('height', 'int', '2', 'marcus', '20140101-000001')
+        del history._indexed
+
+        self.assertEquals([imprint.value for imprint in history.imprints()],
+                          [1, 2])
+
+
+class TestRetention(tests.DynamicTestCase):
+    def setUp(self):
+        super(TestRetention, self).setUp()
+        self.container = self.root.path.as_str
+        self.history = os.path.join(self.container, om.lib.HISTORY)
+        self.addCleanup(om.set_retention, self.root, None)
+
+    def flush(self, values, store):
+        for value in values:
+            om.flush(om.Entry('height', value=value, parent=self.root),
+                     track_history=store)
+
+    def test_select(self):
+        """Imprints are kept by count, age and day"""
+        now = om.api._imprint_seconds('20140110-120000')
+        times = ['20140101-080000', '20140101-090000',
+                 '20140102-080000', '20140109-080000',
+                 '20140110-110000', '20140110-115900']
+
+        self.assertEquals(om.Retention(last=2).select(times, now),
+                          set([4, 5]))
+        self.assertEquals(om.Retention(newer=3600 * 2).select(times, now),
+                          set([4, 5]))
+        self.assertEquals(om.Retention(daily=86400 * 7).select(times, now),
+                          set([1, 2, 3, 4, 5]))
+        self.assertEquals(om.Retention().select(times, now),
+                          set(range(6)))
+
+    def test_compact_directory(self):
+        """Directory imprints not retained are removed"""
+        stamps = iter(['20140101-000000', '20140102-000000',
+                       '20140103-000000', '20140104-000000'])
+        original = om.api._currenttime
+        om.api._currenttime = lambda: next(stamps)
+        try:
+            self.flush(range(5), 'directory')
+        finally:
+            om.api._currenttime = original
+
+        self.assertEquals(len(os.listdir(self.history)), 4)
+        self.assertEquals(om.compact_history(self.root,
+                                             om.Retention(last=2)), 2)
+        self.assertEquals(sorted(os.listdir(self.history)),
+                          ['height&20140103-000000.dict',
+                           'height&20140104-000000.dict'])
+
+    def test_compact_journal(self):
+        """The journal is rewritten with only the imprints retained"""
+        self.flush(range(5), 'journal')
+        om.flush(om.Entry('width', value=1, parent=self.root))
+        om.flush(om.Entry('width', value=2, parent=self.root),
+                 track_history='journal')
+
+        self.assertEquals(om.compact_history(self.root_path,
+                                             om.Retention(last=1)), 3)
+
+        history = journal.Journal(self.container)
+        self.assertEquals([(imprint.name, imprint.value)
+                           for imprint in history.imprints()],
+                          [('height', 3), ('width', 1)])
+        self.assertEquals(len(history._indexed()), 2)
+
+        # Appending continues past the compacted journal
+        self.flush([5], 'journal')
+        self.assertEquals([imprint.value
+                           for imprint in history.imprints('height')],
+                          [3, 4])
+
+    def test_compact_tree(self):
+        """Histories across a tree are compacted in parallel"""
+        for index in range(3):
+            location = om.Location(os.path.join(self.root_path,
+                                                'child%i' % index))
+            for value in range(3):
+                om.flush(om.Entry('height', value=value, parent=location),
+                         track_history='journal')
+
+        self.assertEquals(om.compact_history(self.root_path,
+                                             om.Retention(last=1),
+                                             workers=3), 3)
+
+    def test_compact_after_flush(self):
+        """Histories of a location with a retention are compacted"""
+        om.set_retention(self.root, om.Retention(last=1))
+        self.flush(range(4), 'journal')
+        om.api._compactor.join()
+
+        imprints = journal.Journal(self.container).imprints()
+        self.assertEquals([imprint.value for imprint in imprints], [2])
+
+    def test_compact_imprinted(self):
+        """Histories imprinted elsewhere are found on disk"""
+        self.flush(range(4), 'journal')
+        om.api._imprinted.discard(self.container)
+
+        self.assertEquals(om.compact_history(self.root,
+                                             om.Retention(last=1),
+                                             imprinted=True), 0)
+        self.assertEquals(om.compact_history(self.root,
+                                             om.Retention(last=1)), 2)
+
+    def test_compact_stale(self):
+        """Files of a compaction which did not finish are removed"""
+        self.flush(range(4), 'journal')
+
+        stale = os.path.join(self.history, om.lib.TEMP + 'journal')
+        with open(stale, 'wb') as f:
+            f.write('torn')
+
+        om.compact_history(self.root, om.Retention(last=1))
+        self.assertEquals(sorted(os.listdir(self.history)),
+                          [journal.JOURNAL, journal.INDEX])
+
+
+class TestQuery(tests.DynamicTestCase):
+    stamps = ['20140101-000000', '20140102-000000',
+              '20140103-000000', '20140104-000000']
+
+    def setUp(self):
+        super(TestQuery, self).setUp()
+        self.height = om.Entry('height', value=10, parent=self.root)
+        om.flush(self.root)
+
+    def flush(self, values, store):
+        stamps = iter(self.stamps)
+        original = om.api._currenttime
+        om.api._currenttime = lambda: next(stamps)
+        try:
+            for value in values:
+                self.height.value = value
+                om.flush(self.height, track_history=store)
+        finally:
+            om.api._currenttime = original
+
+    def test_history(self):
+        """Imprints are returned newest first, within range"""
+        for store in ('directory', 'journal'):
+            self.flush([11, 12, 13.5, 14], store)
+
+            imprints = om.history(self.height)
+            self.assertEquals([imprint.time for imprint in imprints],
+                              list(reversed(self.stamps)))
+            self.assertEquals(imprints[0].value, 13.5)
+            self.assertEquals(imprints[0].suffix, 'float')
+            self.assertEquals(imprints[-1].value, 10)
+
+            imprints = om.history(self.height,
+                                  since='20140102-000000',
+                                  until=om.api._imprint_seconds(
+                                      '20140103-000000'))
+            self.assertEquals([imprint.value for imprint in imprints],
+                              [12, 11])
+
+            imprints = om.history(self.height, limit=1)
+            self.assertEquals([imprint.value for imprint in imprints],
+                              [13.5])
+
+            om.recycle(om.Location(self.root_path), permanent=True)
+            om.util.invalidate()
+            self.height = om.Entry('height', value=10, parent=self.root)
+            om.flush(self.root)
+
+    def test_history_lazy(self):
+        """No values are read by history()"""
+        self.flush([11, 12], 'journal')
+
+        original = om.journal.Journal.read
+        om.journal.Journal.read = None
+        try:
+            imprints = om.history(self.height)
+        finally:
+            om.journal.Journal.read = original
+
+        self.assertEquals(len(imprints), 2)
+        self.assertEquals(imprints[0].value, 11)
+
+    def test_history_bounded(self):
+        """Sorted histories are remembered up to HISTORY_CACHE_SIZE"""
+        self.flush([11, 12], 'directory')
+
+        other = om.Location(os.path.join(self.root_path, 'other'))
+        height = om.Entry('height', value=1, parent=other)
+        om.flush(other)
+        height.value = 2
+        om.flush(height, track_history='directory')
+
+        original = om.api.HISTORY_CACHE_SIZE
+        om.api.HISTORY_CACHE_SIZE = 1
+        try:
+            om.history(self.height)
+            om.history(height)
+        finally:
+            om.api.HISTORY_CACHE_SIZE = original
+
+        self.assertEquals(list(om.api._sorted_histories),
+                          [os.path.join(other.path.as_str, om.lib.HISTORY)])
+
+    def test_restore(self):
+        """The value at a given time is restored in one flush"""
+        self.flush([11, 12, 13.5, 14], 'journal')
+
+        self.assertEquals(om.restore(self.height, '20140102-120000').time,
+                          '20140103-000000')
+        self.assertEquals(self.height.value, 12)
+
+        height = om.entry(self.root_path, 'height')
+        om.pull(height)
+        self.assertEquals(height.value, 12)
+        self.assertEquals(height.path.suffix, 'int')
+
+        # Not changed since
+        self.assertEquals(om.restore(self.height, '20991231-000000'), None)
+
+    def test_restore_imprint(self):
+        """An imprint is restored, along with its suffix"""
+        self.flush([11.5, 12], 'directory')
+
+        imprint = om.history(self.height)[0]
+        self.assertEquals(imprint.value, 11.5)
+
+        om.restore(self.height, imprint)
+
+        height = om.entry(self.root_path, 'height')
+        om.pull(height)
+        self.assertEquals(height.value, 11.5)
+        self.assertEquals(height.path.suffix, 'float')
+
+
+class TestAsync(tests.DynamicTestCase):
+    def setUp(self):
+        super(TestAsync, self).setUp()
+        self.container = self.root.path.as_str
+        self.height = om.Entry('height', value=0, parent=self.root)
+        om.flush(self.root)
+
+        om.api.HISTORY_ASYNC = True
+        self.addCleanup(setattr, om.api, 'HISTORY_ASYNC', False)
+
+    def test_async(self):
+        """Imprints are persisted in the background, in order"""
+        persisted = list()
+        original = om.api._write_history
+
+        def write(*imprint):
+            persisted.append(imprint[4])
+            original(*imprint)
+
+        om.api._write_history = write
+        try:
+            for value in range(1, 6):
+                self.height.value = value
+                om.flush(self.height, track_history='journal')
+
+            om.flush_history()
+        finally:
+            om.api._write_history = original
+
+        self.assertEquals(persisted, ['0', '1', '2', '3', '4'])
+        imprints = journal.Journal(self.container).imprints('height')
+        self.assertEquals([imprint.value for imprint in imprints],
+                          [0, 1, 2, 3, 4])
+
+    def test_async_sync(self):
+        """Synchronous history follows imprints captured before it"""
+        self.height.value = 1
+        om.flush(self.height, track_history='journal')
+
+        om.api.HISTORY_ASYNC = False
+        self.height.value = 2
+        om.flush(self.height, track_history='journal')
+
+        self.assertEquals([imprint.value
+                           for imprint in om.history(self.height)],
+                          [1, 0])
+
+    def test_async_error(self):
+        """Errors of the writer surface at the barrier"""
+        original = om.api._write_history
+
+        def write(*imprint):
+            raise IOError("Disk full")
+
+        om.api._write_history = write
+        try:
+            self.height.value = 1
+            om.flush(self.height, track_history='journal')
+            self.assertRaises(IOError, om.flush_history)
+        finally:
+            om.api._write_history = original
+
+        om.flush_history()
+
+    def test_async_queue_size(self):
+        """Changes to HISTORY_QUEUE_SIZE apply to the writer in use"""
+        self.height.value = 1
+        om.flush(self.height, track_history='journal')
+
+        original = om.api.HISTORY_QUEUE_SIZE
+        om.api.HISTORY_QUEUE_SIZE = 2
+        try:
+            self.height.value = 2
+            om.flush(self.height, track_history='journal')
+            self.assertEquals(om.api._history_writer._queue.maxsize, 2)
+        finally:
+            om.api.HISTORY_QUEUE_SIZE = original
+
+        om.flush_history()
+
+
+class TestDelta(tests.DynamicTestCase):
+    def setUp(self):
+        super(TestDelta, self).setUp()
+        self.container = self.root.path.as_str
+        self.history = journal.Journal(self.container)
+
+        om.api.HISTORY_DELTA = True
+        self.addCleanup(setattr, om.api, 'HISTORY_DELTA', False)
+
+    def edit(self, name, values):
+        entry = om.Entry(name, value=values[0], parent=self.root)
+        om.flush(self.root)
+
+        for value in values[1:]:
+            entry.value = value
+            om.flush(entry, track_history='journal')
+
+        return entry
+
+    def values(self, count):
+        """Text of 100 lines, edited one line at a time"""
+        lines = [u'Line %i\n' % index for index in range(100)]
+        values = list()
+        for edit in range(count):
+            lines[edit * 10] = u'Edit %i\n' % edit
+            values.append(u''.join(lines))
+        return values
+
+    def test_text(self):
+        """Lines of text are stored as deltas"""
+        values = self.values(5)
+        self.edit('description.text', values)
+
+        imprints = self.history.imprints()
+        self.assertEquals([imprint.value for imprint in imprints],
+                          values[:-1])
+
+        headers = [self.history.read(imprint)[0] for imprint in imprints]
+        self.assertEquals([header.get('depth') for header in headers],
+                          [None, 1, 2, 3])
+        self.assertTrue(os.path.getsize(self.history.path) <
+                        len(values[0]) * 2)
+
+    def test_string(self):
+        """Strings quoted as JSON are stored as deltas too"""
+        values = [value.rstrip() for value in self.values(3)]
+        self.edit('notes.string', values)
+
+        imprints = self.history.imprints()
+        self.assertEquals([imprint.value for imprint in imprints],
+                          values[:-1])
+        self.assertEquals(self.history.read(imprints[-1])[0].get('depth'),
+                          1)
+
+    def test_snapshot(self):
+        """A full copy is stored every SNAPSHOT_INTERVAL deltas"""
+        original = journal.SNAPSHOT_INTERVAL
+        journal.SNAPSHOT_INTERVAL = 2
+        try:
+            values = self.values(6)
+            self.edit('description.text', values)
+        finally:
+            journal.SNAPSHOT_INTERVAL = original
+
+        imprints = self.history.imprints()
+        self.assertEquals([imprint.value for imprint in imprints],
+                          values[:-1])
+        self.assertEquals([self.history.read(imprint)[0].get('depth')
+                           for imprint in imprints],
+                          [None, 1, 2, None, 1])
+
+    def test_compact(self):
+        """Deltas whose base is compacted away are re-encoded"""
+        values = self.values(6)
+        self.edit('description.text', values)
+
+        om.compact_history(self.root_path, om.Retention(last=3))
+
+        imprints = self.history.imprints()
+        self.assertEquals([imprint.value for imprint in imprints],
+                          values[2:-1])
+        self.assertEquals([self.history.read(imprint)[0].get('depth')
+                           for imprint in imprints],
+                          [None, 1, 2])
@@ -1,5 +1,6 @@
 
 import os
+import time
 
 # Subject
 import openmetadata as om
@@ -64,3 +65,239 @@ class TestInheritRead(tests.FixtureTestCase):
         shot_entry = om.entry(shot_path, 'apps/maya/name')
         om.inherit(shot_entry)
         self.assertEquals(shot_entry.value, 'Maya 2015 Shot 1000')
+
+
+class TestInheritClosest(tests.DynamicTestCase):
+    def setUp(self):
+        super(TestInheritClosest, self).setUp()
+
+        self.group = os.path.join(self.root_path, 'group')
+        self.subgroup = os.path.join(self.group, 'subgroup')
+        os.makedirs(self.subgroup)
+
+        om.flush(om.Entry('height', value=50, parent=self.root))
+        om.flush(om.Entry('height', value=0,
+                          parent=om.Location(self.group)))
+
+    def test_closest_falsy(self):
+        """Closest value wins, even when falsy"""
+        height = om.entry(self.subgroup, 'height')
+        om.inherit(height)
+        self.assertEquals(height.value, 0)
+
+    def test_depth(self):
+        """Inheritance stops after `depth` parents"""
+        om.flush(om.Entry('width', value=10, parent=self.root))
+
+        width = om.entry(self.subgroup, 'width')
+        om.inherit(width, depth=1)
+        self.assertEquals(width.value, None)
+
+        om.inherit(width, depth=2)
+        self.assertEquals(width.value, 10)
+
+    def test_lazy(self):
+        """Lazy inheritance leaves existing values alone"""
+        height = om.Entry('height', value=5,
+                          parent=om.Location(self.subgroup))
+        om.inherit(height, lazy=True)
+        self.assertEquals(height.value, 5)
+
+    def test_own_location(self):
+        """A value at the location itself overrides its parents"""
+        om.flush(om.Entry('height', value=10,
+                          parent=om.Location(self.subgroup)))
+
+        height = om.entry(self.subgroup, 'height')
+        om.inherit(height)
+        self.assertEquals(height.value, 10)
+
+    def test_merge(self):
+        """Children are merged into existing ones, or replace them"""
+        om.Entry('width', value=10, parent=om.Entry('size', parent=self.root))
+        om.flush(self.root)
+
+        size = om.Entry('size', parent=om.Location(self.subgroup))
+        om.Entry('depth', value=5, parent=size)
+        om.inherit(size, merge=True)
+        self.assertEquals(sorted(child.name for child in size),
+                          ['depth', 'width'])
+
+        om.inherit(size)
+        self.assertEquals([child.name for child in size], ['width'])
+
+
+class TestInheritView(tests.FixtureTestCase):
+    def test_entry(self):
+        """View falls through to parents without modifying them"""
+        shot_path = os.path.join(self.project_path, '1000', 'cache')
+        apps = om.entry(shot_path, 'apps')
+
+        view = om.inherit(apps, view=True)
+        self.assertIsInstance(view, om.Layers)
+        self.assertEquals(view['maya']['name'].value,
+                          'Maya 2015 Shot 1000')
+        self.assertEquals(view['maya']['version'].value, 2015)
+        self.assertIsNone(apps._children)
+
+        for layer in view.layers:
+            for child in layer:
+                self.assertIs(child.parent, layer)
+
+    def test_value(self):
+        """View of a value is the closest value"""
+        shot_path = os.path.join(self.project_path, '1000', 'cache')
+        name = om.entry(shot_path, 'apps/maya/name')
+        view = om.inherit(name, view=True)
+        self.assertEquals(view.value, 'Maya 2015 Shot 1000')
+        self.assertEquals(len(view.layers), 1)
+
+    def test_location(self):
+        """View of a location merges children of its parents"""
+        shot = om.Location(os.path.join(self.project_path, '1000'))
+        view = om.inherit(shot, view=True)
+        self.assertIn('apps', view)
+        self.assertIsNone(shot._children)
+
+        with self.assertRaises(KeyError):
+            view['notexist']
+
+
+class TestInheritMany(tests.FixtureTestCase):
+    def test_inherit_many(self):
+        """Each ancestor is pulled once, for all locations"""
+        shot = os.path.join(self.project_path, '1000')
+        cache = os.path.join(shot, 'cache')
+        os.makedirs(cache)
+
+        pulled = list()
+        original = om.api._pull_ancestor
+
+        def pull_ancestor(path):
+            pulled.append(path)
+            return original(path)
+
+        om.api._pull_ancestor = pull_ancestor
+        try:
+            values = om.inherit_many(
+                [shot, cache, self.project_path],
+                ['apps/maya/name', 'apps/maya/version.int', 'notexist'])
+        finally:
+            om.api._pull_ancestor = original
+
+        self.assertEquals(len(pulled), len(set(pulled)))
+        self.assertEquals(values[cache, 'apps/maya/name'],
+                          'Maya 2015 Shot 1000')
+        self.assertEquals(values[cache, 'apps/maya/version.int'], 2015)
+        self.assertEquals(values[self.project_path, 'apps/maya/name'],
+                          'Maya 2015 Base')
+        self.assertEquals(values[shot, 'notexist'], None)
+
+    def test_workers(self):
+        """Pulling ancestors in parallel yields identical results"""
+        shot = os.path.join(self.project_path, '1000')
+        metapaths = ['apps/maya/name', 'height']
+
+        self.assertEquals(om.inherit_many([shot], metapaths),
+                          om.inherit_many([shot], metapaths, workers=4))
+
+
+class TestInheritCache(tests.FixtureTestCase):
+    def setUp(self):
+        super(TestInheritCache, self).setUp()
+        self.cache = os.path.join(self.root_path, 'cache')
+        self.shot = os.path.join(self.project_path, '1000')
+
+        self.addCleanup(setattr, om.api, 'CACHE_DIR', om.api.CACHE_DIR)
+        om.api.CACHE_DIR = self.cache
+
+        self.backdate()
+
+    def backdate(self):
+        """Age the fixture beyond the resolution of the clock"""
+        past = time.time() - 10
+        for dirpath, _, _ in os.walk(self.root_path):
+            os.utime(dirpath, (past, past))
+
+    def test_cache(self):
+        """Cached trees are re-used until an ancestor changes"""
+        name = om.entry(self.shot, 'apps/maya/name')
+        om.inherit(name, cache=True)
+        self.assertEquals(name.value, 'Maya 2015 Shot 1000')
+        self.assertEquals(len(os.listdir(self.cache)), 1)
+
+        views = list()
+        original = om.api._inherit_view
+
+        def inherit_view(*args):
+            views.append(args)
+            return original(*args)
+
+        om.api._inherit_view = inherit_view
+        try:
+            version = om.entry(self.shot, 'apps/maya/version')
+            om.inherit(version, cache=True)
+            self.assertEquals(version.value, 2015)
+            self.assertEquals(views, [])
+
+            # Modify a deeply nested value of an ancestor
+            om.write(self.project_path, 'apps/maya/version', 2016)
+
+            version = om.entry(self.shot, 'apps/maya/version')
+            om.inherit(version, cache=True)
+            self.assertEquals(version.value, 2016)
+            self.assertEquals(len(views), 1)
+        finally:
+            om.api._inherit_view = original
+
+    def test_location(self):
+        """Cached location contains inherited children"""
+        location = om.Location(self.shot)
+        om.inherit(location, cache=True)
+        self.assertEquals(location['apps']['maya']['name'].value,
+                          'Maya 2015 Shot 1000')
+        self.assertEquals(location['height'].value, 10)
+
+    def test_suffix(self):
+        """Cached values keep their suffix"""
+        om.write(self.project_path, 'notes.text', u'Hello')
+
+        notes = om.entry(self.shot, 'notes')
+        om.inherit(notes, cache=True)
+        self.assertEquals(notes.value, u'Hello')
+        self.assertEquals(notes.type, 'text')
+
+    def test_corrupt(self):
+        """Unreadable trees are inherited anew"""
+        om.inherit(om.entry(self.shot, 'apps/maya/name'), cache=True)
+
+        cached, = os.listdir(self.cache)
+        with open(os.path.join(self.cache, cached), 'wb') as f:
+            f.write('ctruncated\n')
+
+        name = om.entry(self.shot, 'apps/maya/name')
+        om.inherit(name, cache=True)
+        self.assertEquals(name.value, 'Maya 2015 Shot 1000')
+
+    def test_racy(self):
+        """Trees stored right after a modification are inherited anew"""
+        container = om.Location(self.project_path).path.as_str
+        tick = int(time.time())
+
+        om.write(self.project_path, 'apps/maya/version', 2016)
+        os.utime(container, (tick, tick))
+        om.inherit(om.entry(self.shot, 'apps/maya/name'), cache=True)
+
+        # Modified again, within the same tick of the clock
+        om.write(self.project_path, 'apps/maya/version', 2017)
+        os.utime(container, (tick, tick))
+
+        version = om.entry(self.shot, 'apps/maya/version')
+        om.inherit(version, cache=True)
+        self.assertEquals(version.value, 2017)
+
+    def test_unset(self):
+        """Caching requires CACHE_DIR"""
+        om.api.CACHE_DIR = None
+        name = om.entry(self.shot, 'apps/maya/name')
+        self.assertRaises(ValueError, om.inherit, name, cache=True)
@@ -1,5 +1,8 @@
 """Test parent/child relationships"""
 
+import gc
+import weakref
+
 # Subject
 import openmetadata as om
 import openmetadata.tests
@@ -11,3 +14,52 @@ class TestEntryRead(openmetadata.tests.FixtureTestCase):
         parent = om.Location(self.root_path)
         entry = om.Entry('test', parent=parent)
         self.assertEquals(entry.path, parent.path + entry.path.basename)
+
+    def test_cached_path_reparent(self):
+        """Cached paths follow re-parenting and changes in suffix"""
+        parent = om.Location(self.root_path)
+        group = om.Entry('group', value='text', parent=parent)
+        child = om.Entry('child', value=1, parent=group)
+        self.assertEquals(group.type, 'dict')
+        self.assertEquals(child.path, group.path + 'child.int')
+
+        other = om.Entry('other.dict', parent=parent)
+        other.add(group)
+        self.assertEquals(child.path,
+                          parent.path + 'other.dict/group.dict/child.int')
+
+        child.value = 'string'
+        self.assertEquals(child.path.basename, 'child.string')
+
+    def test_no_cycles(self):
+        """Pulled trees are freed without the help of the cycle collector"""
+        location = om.Location(self.root_path)
+        om.pull(location)
+        self.assertTrue(location.has_children)
+
+        gc.collect()
+        gc.disable()
+        try:
+            del location
+            self.assertEquals(gc.collect(), 0)
+        finally:
+            gc.enable()
+
+    def test_clear_detaches(self):
+        """Cleared children are detached, keeping their path"""
+        parent = om.Location(self.root_path)
+        group = om.Entry('group', parent=parent)
+        child = om.Entry('child', value=1, parent=group)
+
+        reference = weakref.ref(parent)
+        parent.clear()
+        del parent
+        self.assertEquals(reference(), None)
+
+        self.assertEquals(group.parent, None)
+        group.clear()
+        self.assertEquals(child.parent, None)
+        self.assertTrue(child.path.as_str.endswith('group.dict/child.int'))
+
+        child.value = 'string'
+        self.assertTrue(child.path.as_str.endswith('group.dict/child.string'))
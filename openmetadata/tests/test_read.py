@@ -1,3 +1,5 @@
+import os
+
 import openmetadata as om
 import openmetadata.tests
 
@@ -60,6 +62,105 @@ class TestRead(openmetadata.tests.FixtureTestCase):
         self.assertEquals(value, 'Value')
 
 
+class TestEntry(openmetadata.tests.FixtureTestCase):
+    def test_entry_probes(self):
+        """Each level is listed once, without creating siblings"""
+        listed = list()
+        original = om.util._list
+
+        def list_(path):
+            listed.append(path)
+            return original(path)
+
+        location = om.Location(self.project_path)
+
+        om.util._list = list_
+        try:
+            name = om.entry(location, 'apps/maya/name')
+        finally:
+            om.util._list = original
+
+        self.assertEquals(len(listed), 3)
+        self.assertEquals(name.path.basename, 'name.string')
+        self.assertEquals([child.name for child in location], ['apps'])
+        self.assertEquals([child.name for child in location['apps']],
+                          ['maya'])
+        self.assertFalse(name.isdirty)
+
+    def test_entry_missing(self):
+        """Levels below a missing level are new"""
+        location = om.Location(self.project_path)
+        missing = om.entry(location, 'apps/missing/name.string')
+        self.assertEquals(missing.path.basename, 'name.string')
+        self.assertTrue(missing.isdirty)
+        self.assertTrue(location['apps'].isdirty)
+
+    def test_entry_suffix(self):
+        """Only the suffix of the last level must match"""
+        location = om.Location(self.project_path)
+        name = om.entry(location, 'apps.list/maya/name.string')
+        self.assertEquals(name.parent.parent.path.basename, 'apps.dict')
+        self.assertFalse(name.isdirty)
+
+        name = om.entry(location, 'apps/maya/name.int')
+        self.assertTrue(name.isdirty)
+
+
+class TestListing(openmetadata.tests.DynamicTestCase):
+    def setUp(self):
+        super(TestListing, self).setUp()
+        self.listed = list()
+        self.original = om.util._list
+
+        def list_(path):
+            self.listed.append(path)
+            return self.original(path)
+
+        self.path = os.path.join(self.root_path, 'listed')
+        os.mkdir(self.path)
+        om.util._list = list_
+
+    def tearDown(self):
+        om.util._list = self.original
+        om.util.LISTING_TTL = None
+        super(TestListing, self).tearDown()
+
+    def test_listing_cached(self):
+        """Listings are re-used until their directory is modified"""
+        open(os.path.join(self.path, 'first.string'), 'w').close()
+        os.utime(self.path, (1000, 1000))
+
+        om.util.listdir(self.path)
+        items = om.util.listdir(self.path)
+        self.assertEquals(len(self.listed), 1)
+        self.assertEquals([(item.name, item.suffix, item.isdir)
+                           for item in items],
+                          [('first', 'string', False)])
+
+        open(os.path.join(self.path, 'second.int'), 'w').close()
+        os.utime(self.path, (2000, 2000))
+
+        items = om.util.listdir(self.path)
+        self.assertEquals(len(self.listed), 2)
+        self.assertEquals(sorted(item.basename for item in items),
+                          ['first.string', 'second.int'])
+
+    def test_listing_ttl(self):
+        """Listings younger than the TTL are re-used as-is"""
+        om.util.LISTING_TTL = 60
+        os.utime(self.path, (1000, 1000))
+        om.util.listdir(self.path)
+
+        os.mkdir(os.path.join(self.path, 'group.dict'))
+        os.utime(self.path, (2000, 2000))
+
+        self.assertEquals(om.util.listdir(self.path), ())
+
+        om.util.invalidate(self.path)
+        items = om.util.listdir(self.path)
+        self.assertTrue(items[0].isdir)
+
+
 if __name__ == '__main__':
     import nose
     nose.run()
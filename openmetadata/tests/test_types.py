@@ -6,7 +6,10 @@ Test removal
 
 """
 
+import os
+
 import openmetadata as om
+from openmetadata import lib
 from openmetadata import tests
 
 
@@ -31,3 +34,95 @@ class TestTypes(tests.DynamicTestCase):
         om.pull(dic)
         self.assertEqual(dic.type, 'dict')
         self.assertEqual(dic.name, 'mydict')
+
+
+class TestCodecs(tests.DynamicTestCase):
+    def tearDown(self):
+        for suffix in ('text', 'int', 'float'):
+            om.register_codec(suffix, None)
+        super(TestCodecs, self).tearDown()
+
+    def test_text(self):
+        """Text is stored as-is"""
+        om.register_codec('text', lib.TEXT)
+
+        value = u'Multi-line\n"quoted" \u00e5\u00e4\u00f6'
+        entry = om.Entry('story.text', value=value, parent=self.root)
+        om.flush(entry)
+
+        with open(entry.path.as_str, 'rb') as f:
+            self.assertEquals(f.read(), value.encode('utf-8'))
+
+        self.assertEquals(om.read(self.root_path, 'story'), value)
+
+    def test_numbers(self):
+        """Numbers are stored as fixed-size binary"""
+        om.register_codec('int', lib.INT)
+        om.register_codec('float', lib.FLOAT)
+
+        om.write(self.root_path, 'frames', 1001)
+        om.write(self.root_path, 'fps', 23.976)
+
+        entry = om.entry(self.root_path, 'frames')
+        self.assertEquals(os.path.getsize(entry.path.as_str), 8)
+
+        self.assertEquals(om.read(self.root_path, 'frames'), 1001)
+        self.assertEquals(om.read(self.root_path, 'fps'), 23.976)
+
+    def test_json_default(self):
+        """Suffixes without codec are written as JSON"""
+        om.register_codec('int', lib.INT)
+        om.write(self.root_path, 'active', True)
+        entry = om.entry(self.root_path, 'active')
+
+        with open(entry.path.as_str, 'rb') as f:
+            self.assertEquals(f.read(), 'true')
+
+    def test_blob(self):
+        """Blobs are mapped into memory, rather than read"""
+        data = bytearray('HEADER' + 'x' * 1024)
+        entry = om.Entry('image', value=data, parent=self.root)
+        self.assertEquals(entry.type, 'blob')
+        om.flush(entry)
+
+        entry = om.Entry('image', parent=self.root)
+        om.pull(entry)
+        self.assertEquals(entry.value[:6], 'HEADER')
+        self.assertEquals(len(entry.value), len(data))
+
+        # Flushing a mapped value onto itself
+        om.flush(entry)
+        om.pull(entry)
+        self.assertEquals(entry.value[:6], 'HEADER')
+
+    def test_temp_unlisted(self):
+        """Files left over from a write are not listed"""
+        om.flush(om.Entry('image', value=bytearray('x'), parent=self.root))
+        with open(os.path.join(self.root.path.as_str,
+                               lib.TEMP + 'image.blob'), 'wb') as f:
+            f.write('y')
+
+        om.util.invalidate()
+        location = om.Location(self.root_path)
+        om.pull(location)
+        self.assertEquals([child.name for child in location], ['image'])
+
+    def test_open(self):
+        """Text may be streamed to and from disk"""
+        om.register_codec('text', lib.TEXT)
+
+        entry = om.Entry('story.text', parent=self.root)
+        with entry.open('w') as f:
+            f.write(u'Once upon a time\n')
+            f.write(u'The end')
+
+        with entry.open() as f:
+            self.assertEquals(f.readline(), u'Once upon a time\n')
+
+        self.assertEquals(om.read(self.root_path, 'story'),
+                          u'Once upon a time\nThe end')
+
+    def test_open_json(self):
+        """Values stored as JSON may not be streamed"""
+        entry = om.Entry('story.text', parent=self.root)
+        self.assertRaises(om.error.Serialisation, entry.open)
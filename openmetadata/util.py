@@ -1,17 +1,53 @@
 import os
+import stat
+import time
 import errno
+import threading
+import collections
 
 from openmetadata import lib
 from openmetadata import error
 
+# Listing via scandir classifies entries as directories or files
+# without a stat per entry, where the file-system provides it.
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
 
 __all__ = [
     'split',
     'find_all',
     'find',
+    'index',
+    'listdir',
+    'invalidate',
+    'pin',
     'default',
 ]
 
+# Seconds during which a cached listing is used without
+# checking its directory for modifications, see listdir()
+LISTING_TTL = None
+
+# Maximum number of directory listings to remember
+LISTING_CACHE_SIZE = 1024
+
+# Listings taken within this many seconds of a modification of
+# their directory may predate a second modification within the
+# same tick of the file-system clock, and are never trusted.
+_RACY = 1.0
+
+_listings = collections.OrderedDict()
+_listings_lock = threading.Lock()
+
+# Listings used as-is, without checking for modifications, see pin()
+_pinned = dict()
+
 
 def default(suffix):
     return lib.defaults.get(suffix)
@@ -123,9 +159,6 @@ def find_all(path, name, **kwargs):
 
     """
 
-    if not os.path.isdir(path):
-        return
-
     # Ignore suffix
     suffix = None
     if not name.startswith('.'):
@@ -141,35 +174,240 @@ def find_all(path, name, **kwargs):
     if not container in path:
         path = os.path.join(path, container)
 
-    try:
-        for entry in os.listdir(path):
-            if entry.startswith('.'):
-                search_name = entry
-                search_suffix = None
+    items = listdir(path)
+    if items is None:
+        # Path had no metadata container
+        return
+
+    if ignore_case:
+        name = name.lower()
 
+    for item in items:
+        search_name = item.lower if ignore_case else item.name
+
+        if search_name == name:
+            # If there was a suffix supplied, ensure they match
+            if suffix:
+                if item.suffix == suffix:
+                    yield item.basename
             else:
-                try:
-                    search_name, search_suffix = entry.rsplit(lib.Path.EXT, 1)
-                except ValueError:
-                    search_name, search_suffix = entry, None
-
-            if ignore_case:
-                name = name.lower()
-                search_name = search_name.lower()
-
-            if search_name == name:
-                # If there was a suffix supplied, ensure they match
-                if suffix:
-                    if search_suffix == suffix:
-                        yield entry
-                else:
-                    yield entry
+                yield item.basename
+
+
+def index(path):
+    """Index contents of `path` by lower-case name, excluding suffix
+
+    Names are derived as per :func:`find_all`, such that a lookup
+    of `name` in the returned index is equivalent to find_all()
+    with case ignored, only without listing `path` once per lookup.
+
+    Arguments:
+        path (str): Absolute path of directory to index
+
+    Returns:
+        dict: Lower-case name mapped to list of basenames, in listed
+            order, or None if `path` is not a directory.
+
+    Example
+        Given the directory:
+
+        parent
+        |-- Entry1.list
+        |-- entry2.int
+
+        >> index(path)
+        {'entry1': ['Entry1.list'], 'entry2': ['entry2.int']}
+
+    """
+
+    items = listdir(path)
+    if items is None:
+        return None
+
+    _index = dict()
+    for item in items:
+        _index.setdefault(item.lower, []).append(item.basename)
+
+    return _index
+
+
+class Item(object):
+    """Entry of a directory, as listed by :func:`listdir`
+
+    Attributes:
+        basename: Name as on disk, including suffix
+        name: Name excluding suffix, as per :func:`find_all`
+        lower: Lower-case `name`
+        suffix: Suffix, or None
+        path: Absolute path
+        isdir: Whether entry is a directory, queried upon first access
+
+    """
+
+    __slots__ = ('basename', 'name', 'lower', 'suffix', 'path', '_isdir')
+
+    def __init__(self, directory, basename, isdir=None):
+        if basename.startswith('.'):
+            name, suffix = basename, None
+        else:
+            try:
+                name, suffix = basename.rsplit(lib.Path.EXT, 1)
+            except ValueError:
+                name, suffix = basename, None
+
+        self.basename = basename
+        self.name = name
+        self.lower = name.lower()
+        self.suffix = suffix
+        self.path = os.path.join(directory, basename)
+        self._isdir = isdir
+
+    def __repr__(self):
+        return "%s.%s(%r)" % (__name__, type(self).__name__, self.basename)
+
+    @property
+    def isdir(self):
+        if self._isdir is None:
+            self._isdir = os.path.isdir(self.path)
+        return self._isdir
+
+
+def listdir(path):
+    """List `path`, re-using a previous listing if still valid
+
+    Listings are cached per process and re-used for as long as
+    the modification time of `path` is unchanged, costing a single
+    stat. With `LISTING_TTL` set, listings younger than as many
+    seconds are re-used without a stat, such that modifications
+    by other processes may go unnoticed for as long.
+
+    Where scandir is available, either as part of Python or via
+    the scandir package, whether each entry is a directory is
+    known without querying it separately.
 
+    Pinned listings are returned without touching disk, see :func:`pin`
+
+    Arguments:
+        path (str): Absolute path of directory to list
+
+    Returns:
+        tuple: Item per entry of `path`, or None if `path`
+            is not a directory.
+
+    """
+
+    now = time.time()
+
+    with _listings_lock:
+        pinned = _pinned.get(path)
+        cached = _listings.get(path)
+
+    if pinned is not None:
+        return pinned
+
+    if cached is not None:
+        mtime, listed, checked, items = cached
+        if LISTING_TTL is not None and now - checked < LISTING_TTL:
+            return items
+
+    try:
+        stats = os.stat(path)
     except OSError as e:
-        if e.errno == errno.ENOENT:
-            # Path had no metadata container
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            invalidate(path)
+            return None
+        raise
+
+    if not stat.S_ISDIR(stats.st_mode):
+        invalidate(path)
+        return None
+
+    if (cached is not None and
+            stats.st_mtime == mtime and
+            listed - mtime > _RACY):
+        cached[2] = now
+        return items
+
+    try:
+        items = _list(path)
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            invalidate(path)
+            return None
+        raise
+
+    with _listings_lock:
+        _listings.pop(path, None)
+        if len(_listings) >= LISTING_CACHE_SIZE:
+            _listings.popitem(last=False)
+        _listings[path] = [stats.st_mtime, now, now, items]
+
+    return items
+
+
+def _list(path):
+    """List `path` from disk, bypassing the cache
+
+    Files being written, as per `lib.TEMP`, are left out.
+
+    """
+
+    if _scandir is not None:
+        return tuple(Item(path, entry.name, entry.is_dir())
+                     for entry in _scandir(path)
+                     if not entry.name.startswith(lib.TEMP))
+
+    return tuple(Item(path, basename) for basename in os.listdir(path)
+                 if not basename.startswith(lib.TEMP))
+
+
+def pin(path, items):
+    """Use `items` as the listing of `path` until invalidated
+
+    As opposed to cached listings, pinned listings are never checked
+    against disk, and are only forgotten via :func:`invalidate`.
+
+    Arguments:
+        path (str): Absolute path of directory
+        items (tuple): Items, as returned by :func:`listdir`
+
+    """
+
+    with _listings_lock:
+        _pinned[path] = items
+
+
+def invalidate(path=None, recursive=False):
+    """Forget cached listing of `path`, or of every path if None
+
+    Arguments:
+        path (str, optional): Absolute path of directory
+        recursive (bool, optional): Also forget listings of every
+            directory within `path`
+
+    """
+
+    with _listings_lock:
+        if path is None:
+            _listings.clear()
+            _pinned.clear()
             return
 
+        _listings.pop(path, None)
+        _pinned.pop(path, None)
+
+        if recursive:
+            for cache in (_listings, _pinned):
+                for key in [key for key in cache if _within(key, path)]:
+                    del cache[key]
+
+
+def _within(path, directory):
+    """Return whether `path` is located within `directory`"""
+    directory = directory.rstrip('/\\')
+    return (path.startswith(directory + '/') or
+            path.startswith(directory + os.sep))
+
 
 def find(path, name):
     """Find first match